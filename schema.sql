@@ -61,3 +61,117 @@ CREATE TABLE IF NOT EXISTS weekday_avg (
   avg_price NUMERIC,
   PRIMARY KEY (origin, destination, weekday)
 );
+
+-- Daily minimum per route, maintained by the incremental aggregator
+CREATE TABLE IF NOT EXISTS route_daily_min (
+  origin TEXT,
+  destination TEXT,
+  day DATE,
+  min_price NUMERIC,
+  PRIMARY KEY (origin, destination, day)
+);
+
+-- Last offers_raw.id whose route offers_agg has refreshed (single row)
+CREATE TABLE IF NOT EXISTS agg_watermark (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  last_id INTEGER NOT NULL
+);
+
+-- Range pruning of old aggregates
+CREATE INDEX IF NOT EXISTS idx_offers_agg_day
+  ON offers_agg (day);
+
+-- Keep route_daily_min current on every offers_raw insert
+CREATE TRIGGER IF NOT EXISTS trg_offers_daily_min
+AFTER INSERT ON offers_raw
+WHEN NEW.fetched_at IS NOT NULL AND NEW.price_pln IS NOT NULL
+BEGIN
+  INSERT INTO route_daily_min (origin, destination, day, min_price)
+  VALUES (NEW.origin, NEW.destination, DATE(NEW.fetched_at), NEW.price_pln)
+  ON CONFLICT(origin, destination, day)
+  DO UPDATE SET min_price = MIN(min_price, excluded.min_price);
+END;
+
+-- Per-direction pair STEAL limits, materialised from offers_agg
+CREATE TABLE IF NOT EXISTS route_thresholds (
+  origin TEXT,
+  destination TEXT,
+  avg_price REAL NOT NULL,
+  pair_limit REAL NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (origin, destination)
+);
+
+-- Single-offer STEAL limits per depart weekday (Mon=0), from weekday_avg
+CREATE TABLE IF NOT EXISTS offer_thresholds (
+  origin TEXT,
+  destination TEXT,
+  weekday INTEGER,
+  avg_price REAL NOT NULL,
+  offer_limit REAL NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (origin, destination, weekday)
+);
+
+-- Alerts, written in the same transaction as the offer / pair they announce
+CREATE TABLE IF NOT EXISTS alerts_outbox (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  idem_key TEXT NOT NULL UNIQUE,
+  kind TEXT NOT NULL,
+  ref_id INTEGER NOT NULL,
+  origin TEXT,
+  destination TEXT,
+  depart_date TEXT,
+  return_date TEXT,
+  price REAL,
+  deep_link TEXT,
+  text TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TEXT NOT NULL DEFAULT (datetime('now')),
+  created_at TEXT NOT NULL DEFAULT (datetime('now')),
+  sent_at TEXT,
+  last_error TEXT,
+  discount REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_due
+  ON alerts_outbox (status, next_attempt_at);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_sent
+  ON alerts_outbox (sent_at);
+
+-- Append-only log of delivered alerts (offers and pairs) for the report
+CREATE TABLE IF NOT EXISTS steals (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  sent_at TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  ref_id INTEGER NOT NULL,
+  origin TEXT,
+  destination TEXT,
+  depart_date TEXT,
+  return_date TEXT,
+  price REAL,
+  discount REAL,
+  deep_link TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_steals_sent
+  ON steals (sent_at);
+
+-- One row per alert, when the outbox marks it sent
+CREATE TRIGGER IF NOT EXISTS trg_outbox_sent
+AFTER UPDATE OF status ON alerts_outbox
+WHEN NEW.status = 'sent' AND OLD.status != 'sent'
+BEGIN
+  INSERT INTO steals (
+    sent_at, kind, ref_id, origin, destination,
+    depart_date, return_date, price, discount, deep_link
+  )
+  VALUES (
+    COALESCE(NEW.sent_at, strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    NEW.kind, NEW.ref_id, NEW.origin, NEW.destination,
+    NEW.depart_date, NEW.return_date, NEW.price, NEW.discount,
+    NEW.deep_link
+  );
+END;
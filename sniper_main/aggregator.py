@@ -1,21 +1,72 @@
 from __future__ import annotations
 
 import logging
+import math
+import multiprocessing
+import os
+import pathlib
 import sqlite3
 import tempfile
-from typing import Optional, Union
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import pandas as pd
 
-from .db import DB_FILE, upsert_daily_avg
+from .db import DB_FILE, transaction
 
 logger = logging.getLogger(__name__)
 
+# Shard workers are spawned, not forked: a fork taken while another thread
+# (e.g. the notifier dispatcher) holds a logging or sqlite lock deadlocks.
+_SPAWN = multiprocessing.get_context("spawn")
+
+# ``offers_agg`` rows older than this are pruned after each aggregation.
+AGG_RETENTION_DAYS = 60
+
+# Rough in-memory footprint of one raw row in a pandas chunk (object
+# columns dominate); used to turn a memory budget into a chunk size.
+_BYTES_PER_ROW = 400
+_MIN_CHUNK_ROWS = 1_000
+
+
+# Daily minima -> rolling 30-row mean, evaluated entirely inside SQLite.
+# The last row per route (``rn = 1``) is written as today's aggregate.
+_SQL_AGGREGATE = """
+WITH daily AS (
+    SELECT origin, destination, day, min_price
+      FROM route_daily_min
+     WHERE day >= DATE('now', '-30 days')
+),
+rolling AS (
+    SELECT origin, destination,
+           AVG(min_price) OVER (
+               PARTITION BY origin, destination
+               ORDER BY day
+               ROWS BETWEEN 29 PRECEDING AND CURRENT ROW
+           ) AS mean_price,
+           ROW_NUMBER() OVER (
+               PARTITION BY origin, destination
+               ORDER BY day DESC
+           ) AS rn
+      FROM daily
+)
+INSERT INTO offers_agg (origin, destination, day, mean_price)
+SELECT origin, destination, DATE('now'), mean_price
+  FROM rolling
+ WHERE rn = 1
+ON CONFLICT(origin, destination, day)
+DO UPDATE SET mean_price=excluded.mean_price
+RETURNING origin, destination, day, mean_price
+"""
+
 
 def aggregate(
-    db_path: str = DB_FILE, *, output: Optional[str] = None
+    db_path: str = DB_FILE,
+    *,
+    output: Optional[str] = None,
+    engine: str = "pandas",
 ) -> Union[pd.DataFrame, str, None]:
-    """Compute 30-day average price per route using pandas.
+    """Compute 30-day average price per route.
 
     Parameters
     ----------
@@ -25,74 +76,273 @@ def aggregate(
         ``None``     – return ``None`` (default, backwards compatible).
         ``"df"``     – return ``pandas.DataFrame`` with results.
         ``"csv"``    – write DataFrame to a temporary CSV and return its path.
+    engine:
+        ``"pandas"`` – load the stored daily minima into pandas (default).
+        ``"sql"``    – compute daily minima and the rolling mean with SQLite
+                       window functions and write straight to ``offers_agg``.
     """
 
+    if engine == "sql":
+        return _aggregate_sql(db_path, output=output)
+    if engine != "pandas":
+        raise ValueError(f"Unknown aggregation engine: {engine}")
+
     conn = sqlite3.connect(db_path)
     try:
-        df = pd.read_sql_query(
-            """
-            SELECT origin, destination, DATE(fetched_at) AS day, price_pln
-              FROM offers_raw
-             WHERE fetched_at >= DATE('now', '-30 days')
-            """,
-            conn,
-            parse_dates=["day"],
-        )
+        df = _read_daily_min(conn)
     finally:
         conn.close()
 
+    result_df = _rolling_means(df)
+
+    rows = [
+        (row.origin, row.destination, float(row.mean_price))
+        for row in result_df.itertuples(index=False)
+    ]
+    with transaction(db_path) as conn:
+        _upsert_and_prune(conn, rows)
+
+    return _format_output(result_df, output)
+
+
+def _read_daily_min(
+    conn: sqlite3.Connection,
+    routes: Optional[Sequence[Tuple[str, str]]] = None,
+) -> pd.DataFrame:
+    """Last 30 days of ``route_daily_min`` as ``price_pln`` rows.
+
+    Optionally restricted to *routes*.
+    """
+
+    sql = """
+        SELECT origin, destination, day, min_price AS price_pln
+          FROM route_daily_min
+         WHERE day >= DATE('now', '-30 days')
+    """
+    params: List[str] = []
+    if routes is not None:
+        placeholders = ",".join("(?,?)" for _ in routes)
+        sql += f" AND (origin, destination) IN (VALUES {placeholders})"
+        params = [code for route in routes for code in route]
+    return pd.read_sql_query(sql, conn, params=params, parse_dates=["day"])
+
+
+def _rolling_means(df: pd.DataFrame) -> pd.DataFrame:
+    """Reduce ``(origin, destination, day, price_pln)`` rows to the latest
+    rolling 30-day mean of daily minima per route."""
+
     if df.empty:
-        result_df = pd.DataFrame(
+        return pd.DataFrame(
             columns=["origin", "destination", "day", "mean_price"]
         )
-    else:
-        daily_min = df.groupby(
-            ["origin", "destination", "day"], as_index=False
-        )["price_pln"].min()
-        daily_min = daily_min.sort_values("day")
-        rolling = (
-            daily_min.groupby(["origin", "destination"], as_index=False)
-            .apply(
-                lambda g: g.assign(
-                    mean_price=g["price_pln"]
-                    .rolling(window=30, min_periods=1)
-                    .mean()
-                )
+    daily_min = df.groupby(
+        ["origin", "destination", "day"], as_index=False
+    )["price_pln"].min()
+    daily_min = daily_min.sort_values("day")
+    rolling = (
+        daily_min.groupby(["origin", "destination"], as_index=False)
+        .apply(
+            lambda g: g.assign(
+                mean_price=g["price_pln"]
+                .rolling(window=30, min_periods=1)
+                .mean()
             )
-            .reset_index(drop=True)
-        )
-        result_df = (
-            rolling.sort_values("day")
-            .groupby(["origin", "destination"], as_index=False)
-            .tail(1)[["origin", "destination", "day", "mean_price"]]
         )
+        .reset_index(drop=True)
+    )
+    return (
+        rolling.sort_values("day")
+        .groupby(["origin", "destination"], as_index=False)
+        .tail(1)[["origin", "destination", "day", "mean_price"]]
+    )
 
-    for row in result_df.itertuples(index=False):
-        upsert_daily_avg(
-            row.origin, row.destination, row.mean_price, db_path=db_path
-        )
 
-    # Remove old aggregated records (>60 days) using pandas
-    conn = sqlite3.connect(db_path)
-    try:
-        agg_df = pd.read_sql_query(
-            "SELECT origin, destination, day, mean_price FROM offers_agg",
-            conn,
-            parse_dates=["day"],
+def _aggregate_sql(
+    db_path: str, *, output: Optional[str] = None
+) -> Union[pd.DataFrame, str, None]:
+    """SQL-native variant of :func:`aggregate`.
+
+    No raw rows leave SQLite; only the per-route results come back (via
+    ``RETURNING``) and only when *output* asks for them.
+    """
+
+    with transaction(db_path) as conn:
+        rows = conn.execute(_SQL_AGGREGATE).fetchall()
+        _prune_agg(conn)
+    logger.info("SQL aggregation updated %d routes", len(rows))
+
+    if output is None:
+        return None
+    result_df = pd.DataFrame(
+        rows, columns=["origin", "destination", "day", "mean_price"]
+    )
+    return _format_output(result_df, output)
+
+
+def _upsert_and_prune(conn: sqlite3.Connection, rows: List[Tuple]) -> None:
+    """Write today's ``(origin, destination, mean_price)`` *rows* and prune.
+
+    One ``executemany`` upsert plus one range ``DELETE`` on
+    ``idx_offers_agg_day`` – work is proportional to the change, not to the
+    size of ``offers_agg``, and readers never see an emptied table.
+    """
+    conn.executemany(
+        """
+        INSERT INTO offers_agg (origin, destination, day, mean_price)
+        VALUES (?,?,DATE('now'),?)
+        ON CONFLICT(origin, destination, day)
+        DO UPDATE SET mean_price=excluded.mean_price
+        """,
+        rows,
+    )
+    _prune_agg(conn)
+
+
+def _prune_agg(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "DELETE FROM offers_agg WHERE day < DATE('now', ?)",
+        (f"-{AGG_RETENTION_DAYS} days",),
+    )
+
+
+def aggregate_incremental(db_path: str = DB_FILE) -> int:
+    """Refresh today's averages of routes that received new offers.
+
+    ``route_daily_min`` is kept current by an insert trigger, so only the
+    set of routes with ``offers_raw`` rows above the watermark is needed;
+    their rolling means are recomputed from the stored daily minima.  Cheap
+    enough to run after each poll cycle.  Returns the number of routes
+    updated.
+    """
+
+    with sqlite3.connect(db_path) as conn:
+        max_id = conn.execute("SELECT MAX(id) FROM offers_raw").fetchone()[0]
+        if max_id is None:
+            return 0
+        low = conn.execute(
+            "SELECT COALESCE(MAX(last_id), 0) FROM agg_watermark"
+        ).fetchone()[0]
+        touched = conn.execute(
+            """
+            SELECT DISTINCT origin, destination
+              FROM offers_raw
+             WHERE id > ? AND id <= ?
+               AND DATE(fetched_at) >= DATE('now', '-30 days')
+            """,
+            (low, max_id),
+        ).fetchall()
+
+        conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS touched_routes "
+            "(origin TEXT, destination TEXT)"
+        )
+        conn.execute("DELETE FROM touched_routes")
+        conn.executemany("INSERT INTO touched_routes VALUES (?,?)", touched)
+        conn.execute(
+            """
+            INSERT INTO offers_agg (origin, destination, day, mean_price)
+            SELECT origin, destination, DATE('now'), AVG(min_price)
+              FROM (
+                SELECT m.origin, m.destination, m.min_price,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY m.origin, m.destination
+                           ORDER BY m.day DESC
+                       ) AS rn
+                  FROM route_daily_min m
+                  JOIN touched_routes t
+                    ON t.origin = m.origin AND t.destination = m.destination
+                 WHERE m.day >= DATE('now', '-30 days')
+              )
+             WHERE rn <= 30
+             GROUP BY origin, destination
+            ON CONFLICT(origin, destination, day)
+            DO UPDATE SET mean_price=excluded.mean_price
+            """
+        )
+        conn.execute(
+            "INSERT INTO agg_watermark (id, last_id) VALUES (1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET last_id=excluded.last_id",
+            (max_id,),
         )
-        cutoff = pd.Timestamp.utcnow().tz_localize(
-            None
-        ).normalize() - pd.Timedelta(days=60)
-        filtered = agg_df[agg_df["day"] >= cutoff]
-        conn.execute("DELETE FROM offers_agg")
-        if not filtered.empty:
-            filtered.to_sql(
-                "offers_agg", conn, if_exists="append", index=False
-            )
         conn.commit()
-    finally:
-        conn.close()
 
+    logger.info("Incremental aggregation updated %d routes", len(touched))
+    return len(touched)
+
+
+def store_route_thresholds(
+    db_path: str = DB_FILE,
+    *,
+    offer_k: float,
+    pair_threshold: float,
+) -> int:
+    """Materialise STEAL limits into ``route_thresholds``/``offer_thresholds``.
+
+    Pairs: ``avg_price`` is the 30-day ``offers_agg`` mean (as in
+    :func:`db.get_last_30d_avg`) and ``pair_limit`` is that mean scaled by
+    ``1 - pair_threshold``.  Single offers: per route and depart weekday,
+    ``offer_limit`` is the ``weekday_avg`` price minus *offer_k* population
+    standard deviations of the last 90 days of offers for that weekday.
+    Both tables are replaced in one transaction.  Returns the number of
+    ``route_thresholds`` rows.
+    """
+
+    with transaction(db_path) as conn:
+        conn.execute("DELETE FROM route_thresholds")
+        count = conn.execute(
+            """
+            INSERT INTO route_thresholds (
+                origin, destination, avg_price, pair_limit, updated_at
+            )
+            SELECT origin, destination, avg_price, avg_price * (1 - ?),
+                   CURRENT_TIMESTAMP
+              FROM (
+                SELECT origin, destination, AVG(mean_price) AS avg_price
+                  FROM offers_agg
+                 WHERE date(day) >= date('now', '-30 day')
+                 GROUP BY origin, destination
+              )
+             WHERE avg_price IS NOT NULL
+            """,
+            (pair_threshold,),
+        ).rowcount
+
+        # weekday_avg uses pandas' Monday=0; strftime('%w') has Sunday=0.
+        stats = conn.execute(
+            """
+            SELECT w.origin, w.destination, w.weekday, w.avg_price,
+                   AVG((r.price_pln - w.avg_price)
+                       * (r.price_pln - w.avg_price))
+              FROM weekday_avg w
+              JOIN offers_raw r
+                ON r.origin = w.origin AND r.destination = w.destination
+               AND (CAST(strftime('%w', r.depart_date) AS INTEGER) + 6) % 7
+                   = w.weekday
+             WHERE r.fetched_at >= DATE('now', '-90 day')
+             GROUP BY w.origin, w.destination, w.weekday
+            """
+        ).fetchall()
+        conn.execute("DELETE FROM offer_thresholds")
+        conn.executemany(
+            "INSERT INTO offer_thresholds (origin, destination, weekday, "
+            "avg_price, offer_limit, updated_at) "
+            "VALUES (?,?,?,?,?,CURRENT_TIMESTAMP)",
+            [
+                (origin, dest, weekday, avg, avg - offer_k * math.sqrt(var))
+                for origin, dest, weekday, avg, var in stats
+            ],
+        )
+    logger.info(
+        "Stored STEAL thresholds for %d routes (%d route-weekdays)",
+        count,
+        len(stats),
+    )
+    return count
+
+
+def _format_output(
+    result_df: pd.DataFrame, output: Optional[str]
+) -> Union[pd.DataFrame, str, None]:
     if output == "df":
         return result_df.reset_index(drop=True)
     if output == "csv":
@@ -119,42 +369,223 @@ def compute_weekday_averages(db_path: str = DB_FILE) -> pd.DataFrame:
     finally:
         conn.close()
 
+    return _weekday_means(df)
+
+
+def _weekday_means(df: pd.DataFrame) -> pd.DataFrame:
+    """Average ``price_pln`` per route and weekday of the ``depart`` date."""
+
     if df.empty:
         return pd.DataFrame(
             columns=["origin", "destination", "weekday", "avg_price"]
         )
 
-    df["weekday"] = df["depart"].dt.dayofweek
-    result_df = (
+    df["weekday"] = _depart_weekday(df["depart"])
+    return (
         df.groupby(["origin", "destination", "weekday"], as_index=False)[
             "price_pln"
         ]
         .mean()
         .rename(columns={"price_pln": "avg_price"})
     )
-    return result_df
 
 
 def store_weekday_averages(db_path: str = DB_FILE) -> None:
-    """Compute weekday averages and store them in ``weekday_avg`` table."""
+    """Compute weekday averages and store them in ``weekday_avg`` table.
+
+    The new rows go into a shadow table that replaces ``weekday_avg`` with
+    ``ALTER TABLE ... RENAME`` in the same transaction, so concurrent
+    readers see either the old or the new averages – never a missing or
+    half-filled table.
+    """
 
     df = compute_weekday_averages(db_path)
+    rows = [
+        (r.origin, r.destination, int(r.weekday), float(r.avg_price))
+        for r in df.itertuples(index=False)
+    ]
+    with transaction(db_path) as conn:
+        _swap_weekday_avg(conn, rows)
+
+
+def _depart_weekday(depart: pd.Series) -> pd.Series:
+    """Weekday of each ``depart`` value; unparsable dates become ``NaN``.
+
+    ``groupby`` drops the ``NaN`` keys, so malformed rows are skipped the
+    same way in every engine instead of aborting the aggregation.
+    """
+
+    return pd.to_datetime(depart, errors="coerce").dt.dayofweek
+
+
+def _swap_weekday_avg(conn: sqlite3.Connection, rows: List[Tuple]) -> None:
+    conn.execute("DROP TABLE IF EXISTS weekday_avg_new")
+    conn.execute(
+        """
+        CREATE TABLE weekday_avg_new (
+            origin TEXT,
+            destination TEXT,
+            weekday INTEGER,
+            avg_price NUMERIC,
+            PRIMARY KEY (origin, destination, weekday)
+        )
+        """
+    )
+    conn.executemany("INSERT INTO weekday_avg_new VALUES (?,?,?,?)", rows)
+    conn.execute("DROP TABLE IF EXISTS weekday_avg")
+    conn.execute("ALTER TABLE weekday_avg_new RENAME TO weekday_avg")
+
+
+def aggregate_parallel(
+    db_path: str = DB_FILE, *, workers: Optional[int] = None
+) -> int:
+    """Recompute ``offers_agg`` and ``weekday_avg`` on a process pool.
+
+    Routes seen in the last 90 days are split into shards; each worker
+    opens the database read-only and returns rolling means and weekday
+    averages for its shard.  All results are then written by this process
+    in a single transaction.  Returns the number of routes processed.
+    """
+
+    workers = workers or os.cpu_count() or 1
     with sqlite3.connect(db_path) as conn:
-        conn.execute("DROP TABLE IF EXISTS weekday_avg")
-        conn.execute(
+        routes = conn.execute(
+            """
+            SELECT DISTINCT origin, destination
+              FROM offers_raw
+             WHERE fetched_at >= DATE('now', '-90 day')
+             ORDER BY origin, destination
             """
-            CREATE TABLE IF NOT EXISTS weekday_avg (
-                origin TEXT,
-                destination TEXT,
-                weekday INTEGER,
-                avg_price NUMERIC,
-                PRIMARY KEY (origin, destination, weekday)
+        ).fetchall()
+
+    # More shards than workers evens out skew between busy and quiet routes.
+    n_shards = min(len(routes), workers * 4)
+    shards = [routes[i::n_shards] for i in range(n_shards)]
+
+    agg_rows: List[Tuple] = []
+    weekday_rows: List[Tuple] = []
+    if shards:
+        with ProcessPoolExecutor(workers, mp_context=_SPAWN) as pool:
+            for shard_agg, shard_weekday in pool.map(
+                _aggregate_shard, [db_path] * len(shards), shards
+            ):
+                agg_rows.extend(shard_agg)
+                weekday_rows.extend(shard_weekday)
+
+    with transaction(db_path) as conn:
+        _upsert_and_prune(conn, agg_rows)
+        _swap_weekday_avg(conn, weekday_rows)
+
+    logger.info(
+        "Parallel aggregation: %d routes in %d shards on %d workers",
+        len(routes),
+        len(shards),
+        workers,
+    )
+    return len(routes)
+
+
+def _aggregate_shard(
+    db_path: str, routes: Sequence[Tuple[str, str]]
+) -> Tuple[List[Tuple], List[Tuple]]:
+    """Worker: rolling means and weekday averages for *routes* only."""
+
+    uri = pathlib.Path(db_path).resolve().as_uri() + "?mode=ro"
+    placeholders = ",".join("(?,?)" for _ in routes)
+    params = [code for route in routes for code in route]
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        means = _rolling_means(_read_daily_min(conn, routes))
+        weekdays = _weekday_means(
+            pd.read_sql_query(
+                f"""
+                SELECT origin, destination, depart_date AS depart, price_pln
+                  FROM offers_raw
+                 WHERE fetched_at >= DATE('now', '-90 day')
+                   AND (origin, destination) IN (VALUES {placeholders})
+                """,
+                conn,
+                params=params,
+                parse_dates=["depart"],
             )
+        )
+    finally:
+        conn.close()
+
+    return (
+        [
+            (r.origin, r.destination, float(r.mean_price))
+            for r in means.itertuples(index=False)
+        ],
+        [
+            (r.origin, r.destination, int(r.weekday), float(r.avg_price))
+            for r in weekdays.itertuples(index=False)
+        ],
+    )
+
+
+def aggregate_streaming(
+    db_path: str = DB_FILE, *, memory_mb: int = 256
+) -> int:
+    """Recompute ``offers_agg`` and ``weekday_avg`` in bounded memory.
+
+    ``offers_raw`` is read in chunks sized to fit *memory_mb*; each chunk
+    is folded into per-route weekday sums and counts and discarded, so peak
+    memory depends on the number of routes, not on the number of offers.
+    Rolling means come from the (already compact) ``route_daily_min``.
+    Produces the same results as :func:`aggregate` plus
+    :func:`store_weekday_averages`.  Returns the number of raw rows read.
+    """
+
+    budget = memory_mb * 1024 * 1024
+    chunk_rows = max(_MIN_CHUNK_ROWS, budget // _BYTES_PER_ROW)
+    weekday_acc: Dict[Tuple[str, str, int], List[float]] = {}
+    total = 0
+
+    conn = sqlite3.connect(db_path)
+    try:
+        chunks = pd.read_sql_query(
             """
+            SELECT origin, destination, depart_date AS depart, price_pln
+              FROM offers_raw
+             WHERE fetched_at >= DATE('now', '-90 day')
+            """,
+            conn,
+            chunksize=chunk_rows,
         )
-        if not df.empty:
-            df.to_sql("weekday_avg", conn, if_exists="append", index=False)
-        conn.commit()
+        for chunk in chunks:
+            total += len(chunk)
+            chunk["weekday"] = _depart_weekday(chunk["depart"])
+            sums = chunk.groupby(["origin", "destination", "weekday"])[
+                "price_pln"
+            ].agg(["sum", "count"])
+            for (origin, dest, weekday), row in sums.iterrows():
+                acc = weekday_acc.setdefault(
+                    (origin, dest, int(weekday)), [0.0, 0]
+                )
+                acc[0] += row["sum"]
+                acc[1] += row["count"]
+        daily_df = _read_daily_min(conn)
+    finally:
+        conn.close()
+
+    agg_rows = [
+        (r.origin, r.destination, float(r.mean_price))
+        for r in _rolling_means(daily_df).itertuples(index=False)
+    ]
+    weekday_rows = [
+        (origin, dest, weekday, float(acc[0] / acc[1]))
+        for (origin, dest, weekday), acc in sorted(weekday_acc.items())
+    ]
+
+    with transaction(db_path) as conn:
+        _upsert_and_prune(conn, agg_rows)
+        _swap_weekday_avg(conn, weekday_rows)
+
+    logger.info(
+        "Streaming aggregation: %d rows in chunks of %d", total, chunk_rows
+    )
+    return total
 
 
 def main() -> None:
@@ -0,0 +1,145 @@
+"""Cross-route price anomalies from a price-vs-distance regression.
+
+Per-route baselines need history; a route fetched for the first time has
+none.  Instead, every offer fetched in the last *days* is used to fit one
+model of the expected fare::
+
+    log(price) ~ 1 + log(km) + log(km)² + stops + log1p(days to departure)
+
+by least squares over the whole batch.  Offers whose log price sits more
+than *z* robust standard deviations (1.4826 × MAD of the residuals) below
+the curve are anomalies – on new and established routes alike.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Optional
+
+import numpy as np
+
+from .db import DB_FILE, parse_day
+from .geo import distance_km_array
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Anomaly:
+    offer_id: int
+    origin: str
+    destination: str
+    depart_date: str
+    price: float
+    expected_price: float
+    z: float
+
+    @property
+    def discount(self) -> float:
+        """Fraction below the expected fare (0.4 = 40 % cheaper)."""
+        return 1 - self.price / self.expected_price
+
+
+def _design(
+    km: np.ndarray, stops: np.ndarray, lead_days: np.ndarray
+) -> np.ndarray:
+    log_km = np.log(km)
+    return np.column_stack(
+        [
+            np.ones_like(log_km),
+            log_km,
+            log_km**2,
+            stops,
+            np.log1p(np.maximum(lead_days, 0)),
+        ]
+    )
+
+
+def detect_anomalies(
+    db_path: str = DB_FILE,
+    *,
+    since_id: int = 0,
+    days: int = 14,
+    z: float = 3.0,
+    min_samples: int = 50,
+    today: Optional[date] = None,
+) -> List[Anomaly]:
+    """Fit the fare curve on recent offers and flag those far below it.
+
+    Only offers with ``id > since_id`` and no alert sent yet are reported
+    (the whole window is still used for fitting), cheapest relative to
+    the curve first.  Offers on unknown airports or without a valid
+    departure date are ignored; with fewer than *min_samples* usable
+    offers nothing is flagged.
+    """
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            """
+            SELECT id, origin, destination, depart_date, price_pln,
+                   COALESCE(stops, 0), COALESCE(alert_sent, 0)
+              FROM offers_raw
+             WHERE fetched_at >= DATE('now', ?)
+               AND depart_date IS NOT NULL
+               AND price_pln > 0
+            """,
+            (f"-{days} day",),
+        ).fetchall()
+    if not rows:
+        return []
+
+    ids, origins, dests, departs, prices, stops, sent = map(list, zip(*rows))
+    ids = np.array(ids)
+    fresh = (ids > since_id) & (np.array(sent) == 0)
+    prices = np.array(prices, dtype=float)
+    stops = np.array(stops, dtype=float)
+    km = distance_km_array(origins, dests)
+    today = np.datetime64(today or date.today(), "D")
+    # Per value: one malformed depart_date becomes NaT instead of raising
+    days = np.array(
+        [parse_day(d) or "NaT" for d in departs], dtype="datetime64[D]"
+    )
+    dated = ~np.isnat(days)
+    lead_days = np.zeros(len(days))
+    lead_days[dated] = (days[dated] - today).astype(float)
+
+    usable = np.isfinite(km) & (km > 0) & dated
+    if usable.sum() < min_samples:
+        logger.info("Anomaly model skipped: %d usable offers", usable.sum())
+        return []
+
+    x = _design(km[usable], stops[usable], lead_days[usable])
+    y = np.log(prices[usable])
+    coef, *_ = np.linalg.lstsq(x, y, rcond=None)
+    resid = y - x @ coef
+    scale = 1.4826 * np.median(np.abs(resid - np.median(resid)))
+    if scale <= 0:
+        return []
+    scores = resid / scale
+
+    idx = np.flatnonzero(usable)
+    flagged = np.flatnonzero((scores <= -z) & fresh[idx])
+    found = [
+        Anomaly(
+            offer_id=int(ids[idx[i]]),
+            origin=origins[idx[i]],
+            destination=dests[idx[i]],
+            depart_date=departs[idx[i]],
+            price=float(prices[idx[i]]),
+            expected_price=float(np.exp(y[i] - resid[i])),
+            z=float(scores[i]),
+        )
+        for i in flagged[np.argsort(scores[flagged])]
+    ]
+    logger.info(
+        "Anomaly model: %d offers, scale %.3f, %d flagged",
+        len(y),
+        scale,
+        len(found),
+    )
+    return found
+
+
+__all__ = ["Anomaly", "detect_anomalies"]
@@ -0,0 +1,137 @@
+"""Build ``data/airports.bin`` – the airport table used by :mod:`geo`.
+
+Usage::
+
+    python -m sniper_main.build_airports airports.csv [iata_macs.csv]
+
+Reads an airport CSV in the ``airportsdata`` layout (``iata``, ``lat``,
+``lon``) or the OurAirports layout (``iata_code``, ``latitude_deg``,
+``longitude_deg``).  An optional metropolitan-area CSV (``City Code``,
+``Airport Code``) adds city codes such as ``ROM`` or ``LON`` at the mean
+position of their airports, and is copied next to the table as
+``iata_macs.csv`` for :func:`geo.metro_areas`.
+
+File layout (little endian)::
+
+    b"APT1"  uint32 count
+    count × 3 bytes   IATA codes, ASCII, sorted
+    zero padding to a multiple of 4 bytes
+    count × float32   latitude in degrees
+    count × float32   longitude in degrees
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import pathlib
+import shutil
+import struct
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"APT1"
+HEADER = struct.Struct("<4sI")
+DATA_FILE = pathlib.Path(__file__).resolve().parent / "data" / "airports.bin"
+
+
+def _read_airports(path: pathlib.Path) -> Dict[str, Tuple[float, float]]:
+    airports: Dict[str, Tuple[float, float]] = {}
+    with open(path, newline="", encoding="utf-8") as fh:
+        reader = csv.DictReader(fh)
+        fields = set(reader.fieldnames or ())
+        if {"iata", "lat", "lon"} <= fields:
+            code_col, lat_col, lon_col = "iata", "lat", "lon"
+        elif {"iata_code", "latitude_deg", "longitude_deg"} <= fields:
+            code_col, lat_col, lon_col = (
+                "iata_code",
+                "latitude_deg",
+                "longitude_deg",
+            )
+        else:
+            raise ValueError(f"Unrecognised airport CSV columns in {path}")
+        for row in reader:
+            code = (row[code_col] or "").strip().upper()
+            if len(code) != 3 or not code.isalpha():
+                continue
+            try:
+                coords = (float(row[lat_col]), float(row[lon_col]))
+            except ValueError:
+                continue
+            airports.setdefault(code, coords)
+    return airports
+
+
+def _add_city_codes(
+    airports: Dict[str, Tuple[float, float]], path: pathlib.Path
+) -> int:
+    members: Dict[str, list] = {}
+    with open(path, newline="", encoding="utf-8") as fh:
+        for row in csv.DictReader(fh):
+            city = row["City Code"].strip().upper()
+            coords = airports.get(row["Airport Code"].strip().upper())
+            if coords is not None:
+                members.setdefault(city, []).append(coords)
+    added = 0
+    for city, coords in members.items():
+        if city not in airports:
+            lats, lons = zip(*coords)
+            airports[city] = (sum(lats) / len(lats), sum(lons) / len(lons))
+            added += 1
+    return added
+
+
+def write_table(
+    airports: Dict[str, Tuple[float, float]], path: pathlib.Path
+) -> None:
+    codes = sorted(airports)
+    count = len(codes)
+    body = "".join(codes).encode("ascii")
+    pad = -(HEADER.size + len(body)) % 4
+    lat = np.array([airports[c][0] for c in codes], dtype="<f4")
+    lon = np.array([airports[c][1] for c in codes], dtype="<f4")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, count))
+        fh.write(body)
+        fh.write(b"\0" * pad)
+        fh.write(lat.tobytes())
+        fh.write(lon.tobytes())
+
+
+def build(
+    airports_csv: pathlib.Path,
+    macs_csv: Optional[pathlib.Path] = None,
+    out: pathlib.Path = DATA_FILE,
+) -> int:
+    airports = _read_airports(airports_csv)
+    cities = _add_city_codes(airports, macs_csv) if macs_csv else 0
+    write_table(airports, out)
+    if macs_csv:
+        macs_out = out.with_name("iata_macs.csv")
+        if macs_csv.resolve() != macs_out.resolve():
+            shutil.copyfile(macs_csv, macs_out)
+    logger.info(
+        "Wrote %d codes (%d city codes) to %s", len(airports), cities, out
+    )
+    return len(airports)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("airports_csv", type=pathlib.Path)
+    parser.add_argument("macs_csv", type=pathlib.Path, nargs="?")
+    parser.add_argument("--out", type=pathlib.Path, default=DATA_FILE)
+    args = parser.parse_args()
+    count = build(args.airports_csv, args.macs_csv, args.out)
+    print(f"{count} codes -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Self-transfer search over stored one-way legs.
+
+Finds ``A → H → B`` itineraries built from two separate ``offers_raw``
+offers that together undercut the direct ``A → B`` fare.  The legs
+fetched in the last *hours* form a time-expanded graph whose nodes are
+``(airport, departure day)``; second legs are scanned cheapest first so
+the price bound cuts each search short.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import sqlite3
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .db import DB_FILE, parse_day
+from .geo import distance_matrix
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Connection:
+    origin: str
+    hub: str
+    destination: str
+    depart_date: date
+    connect_date: date
+    first_id: int
+    second_id: int
+    price_total: float
+    direct_price: float
+
+    @property
+    def saving(self) -> float:
+        return self.direct_price - self.price_total
+
+
+# (id, origin, destination, depart, price, total_time_h)
+_Leg = Tuple[int, str, str, date, float, float]
+
+
+def _load_legs(db_path: str, hours: int, max_stops: int) -> List[_Leg]:
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            """
+            SELECT id, origin, destination, depart_date, price_pln,
+                   total_time_h
+              FROM offers_raw
+             WHERE datetime(fetched_at) >= datetime('now', ?)
+               AND depart_date IS NOT NULL
+               AND stops <= ?
+            """,
+            (f"-{hours} hours", max_stops),
+        ).fetchall()
+    legs = []
+    for leg_id, origin, dest, depart, price, total_h in rows:
+        day = parse_day(depart)
+        if day is not None:
+            total = float(total_h or 0.0)
+            legs.append((leg_id, origin, dest, day, float(price), total))
+    if len(legs) < len(rows):
+        logger.warning(
+            "Skipped %d legs with a bad depart_date", len(rows) - len(legs)
+        )
+    return legs
+
+
+def find_self_transfers(
+    db_path: str = DB_FILE,
+    *,
+    hours: int = 24,
+    hubs: Optional[Iterable[str]] = None,
+    min_connect_h: float = 3.0,
+    max_layover_days: int = 2,
+    max_detour: float = 1.5,
+    max_stops: int = 1,
+) -> List[Connection]:
+    """Return the cheapest self-transfer per (origin, destination, day).
+
+    Only legs departing on known dates are stored, so the connection is
+    checked at day granularity: the second leg must leave at least
+    ``ceil((total_time_h + min_connect_h) / 24)`` days (never the same
+    day) and at most *max_layover_days* after the first.  Candidates are
+    pruned by the direct fare (``A → B`` on the same day, else the route's
+    cheapest in the window) and by the great-circle detour ratio
+    ``(d(A,H) + d(H,B)) / d(A,B) <= max_detour``.
+    """
+
+    legs = _load_legs(db_path, hours, max_stops)
+    hub_set = {h.upper() for h in hubs} if hubs else None
+
+    direct_day: Dict[Tuple[str, str, date], float] = {}
+    direct_any: Dict[Tuple[str, str], float] = {}
+    by_node: Dict[Tuple[str, date], List[_Leg]] = {}
+    for leg in legs:
+        _, origin, dest, depart, price, _ = leg
+        key = (origin, dest, depart)
+        direct_day[key] = min(price, direct_day.get(key, math.inf))
+        direct_any[(origin, dest)] = min(
+            price, direct_any.get((origin, dest), math.inf)
+        )
+        by_node.setdefault((origin, depart), []).append(leg)
+    for node_legs in by_node.values():
+        node_legs.sort(key=lambda leg: leg[4])
+
+    # Upper bound on any direct fare out of each origin.
+    bound_from: Dict[str, float] = {}
+    for (origin, _), price in direct_any.items():
+        bound_from[origin] = max(price, bound_from.get(origin, 0.0))
+    for (origin, _, _), price in direct_day.items():
+        bound_from[origin] = max(price, bound_from.get(origin, 0.0))
+
+    airports = {leg[1] for leg in legs} | {leg[2] for leg in legs}
+    km = distance_matrix(airports, airports, persist=False)
+
+    def detour_ok(a: str, h: str, b: str) -> bool:
+        try:
+            direct = km.get(a, b)
+            via = km.get(a, h) + km.get(h, b)
+        except KeyError:
+            return False
+        return direct > 0 and via / direct <= max_detour
+
+    best: Dict[Tuple[str, str, date], Connection] = {}
+    for first in legs:
+        first_id, a, h, d1, p1, total_h = first
+        if hub_set is not None and h not in hub_set:
+            continue
+        bound = bound_from.get(a)
+        if bound is None or p1 >= bound:
+            continue
+        gap = max(1, math.ceil((total_h + min_connect_h) / 24))
+        for offset in range(gap, max_layover_days + 1):
+            d2 = d1 + timedelta(days=offset)
+            for second in by_node.get((h, d2), ()):
+                second_id, _, b, _, p2, _ = second
+                total = p1 + p2
+                if total >= bound:
+                    break  # sorted by price: nothing cheaper follows
+                if b == a:
+                    continue
+                direct = direct_day.get((a, b, d1), direct_any.get((a, b)))
+                if direct is None or total >= direct:
+                    continue
+                key = (a, b, d1)
+                if key in best and best[key].price_total <= total:
+                    continue
+                if not detour_ok(a, h, b):
+                    continue
+                best[key] = Connection(
+                    origin=a,
+                    hub=h,
+                    destination=b,
+                    depart_date=d1,
+                    connect_date=d2,
+                    first_id=first_id,
+                    second_id=second_id,
+                    price_total=total,
+                    direct_price=direct,
+                )
+
+    result = sorted(best.values(), key=lambda c: c.saving, reverse=True)
+    logger.info(
+        "Self-transfer search: %d legs, %d connections", len(legs), len(result)
+    )
+    return result
+
+
+__all__ = ["Connection", "find_self_transfers"]
@@ -12,35 +12,49 @@ logger = logging.getLogger(__name__)
 
 
 def send_daily_report(db_path: str = DB_FILE) -> None:
-    """Send daily summary email for STEAL deals."""
+    """Send daily summary email for STEAL deals (offers and pairs).
+
+    Reads only the ``steals`` log (one row per delivered alert, indexed
+    by ``sent_at``) and renders the rows as they are read.
+    """
     conn = sqlite3.connect(db_path)
-    cur = conn.execute(
-        """
-        SELECT origin, destination, depart_date, return_date,
-               price_pln, deep_link
-          FROM offers_raw
-         WHERE alert_sent = 1
-           AND fetched_at >= DATE('now', '-1 day')
-         ORDER BY price_pln ASC
-        """
-    )
-    rows = cur.fetchall()
-    conn.close()
+    try:
+        rows = conn.execute(
+            """
+            SELECT kind, origin, destination, depart_date, return_date,
+                   price, deep_link
+              FROM steals
+             WHERE sent_at >= datetime('now', '-1 day')
+             ORDER BY price ASC
+            """
+        )
+        body = []
+        for kind, origin, dest, dep, ret, price, link in rows:
+            route = f"{origin}&nbsp;→&nbsp;{dest}"
+            if kind == "pair":
+                route += " (para)"
+            dates = f"{dep}&nbsp;→&nbsp;{ret or 'OW'}"
+            price_cell = f"{price:.0f} PLN"
+            if link:
+                price_cell = (
+                    f"<a href='{html.escape(link)}'>{price_cell}</a>"
+                )
+            body.append(
+                f"<tr><td>{route}</td><td>{dates}</td>"
+                f"<td>{price_cell}</td></tr>"
+            )
+    finally:
+        conn.close()
 
-    if not rows:
+    if not body:
         return
 
-    body = ["<h2>STEAL deals – ostatnie 24 h</h2><table border=1>"]
-    body.append("<tr><th>Route</th><th>Dates</th><th>Price</th></tr>")
-    for origin, dest, dep, ret, price, link in rows:
-        route = f"{origin}&nbsp;→&nbsp;{dest}"
-        dates = f"{dep}&nbsp;→&nbsp;{ret}"
-        body.append(
-            f"<tr><td>{route}</td><td>{dates}</td><td>"
-            f"<a href='{html.escape(link)}'>{price} PLN</a></td></tr>"
-        )
-    body.append("</table>")
-    send_email_daily("".join(body))
+    send_email_daily(
+        "<h2>STEAL deals – ostatnie 24 h</h2><table border=1>"
+        "<tr><th>Route</th><th>Dates</th><th>Price</th></tr>"
+        + "".join(body)
+        + "</table>"
+    )
 
 
 def main() -> None:
@@ -1,25 +1,33 @@
 from __future__ import annotations
 
 import logging
-from datetime import date
+from datetime import date, datetime, timezone
 from decimal import Decimal
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import time
 
 import click
 
 from .aviasales_fetcher import AviasalesFetcher
 from .config import Config
-from .steal_engine import is_weekday_steal
-from .pair_engine import process_outbound
-from .notifier import send_telegram
+from .steal_engine import is_offer_steal
+from .pair_engine import process_run, refresh_thresholds
+from .notifier import deliver_alerts, flush_telegram
 from . import aggregator, daily_report
+from .anomaly import detect_anomalies
+from .connections import find_self_transfers
+from .fetch_planner import plan_routes
+from .outbox import alert_latencies
 from .db import (
+    backfill_daily_min,
     insert_offer,
-    mark_alert_sent,
+    last_offer_id,
     get_last_30d_avg,
+    load_offer_thresholds,
     DB_FILE,
+    enqueue_alert,
     migrate,
+    transaction,
 )
 
 # ────────────────────────────────────────────────────────────────
@@ -47,6 +55,17 @@ def travel_days(dep: date | None, ret: date | None) -> int:
     return (ret - dep).days
 
 
+def _fetch_plan() -> List[Tuple[str, str]]:
+    """Trasy do pobrania: watchlista rozszerzona o pobliskie lotniska."""
+    return plan_routes(
+        cfg.origins or [],
+        cfg.destinations or [],
+        radius_km=getattr(cfg, "nearby_radius_km", 0),
+        max_extra=getattr(cfg, "nearby_max_airports", 3),
+        served=getattr(cfg, "nearby_airports", None) or None,
+    )
+
+
 # ────────────────────────────────────────────────────────────────
 # Główna logika
 # ────────────────────────────────────────────────────────────────
@@ -54,67 +73,107 @@ def travel_days(dep: date | None, ret: date | None) -> int:
 
 def run_once(dep_date: Optional[str] = None) -> None:
     total_inserted: List[int] = []
+    first_id = last_offer_id(db_path=DB_FILE)
+    cycle_start = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    # Progi STEAL (oferty wg dnia tygodnia i pary), raz na przebieg
+    refresh_thresholds()
+    offer_limits = load_offer_thresholds(DB_FILE)
+
+    for origin, dest in _fetch_plan():
+        logger.info("Fetching: %s ➔ %s", origin, dest)
+        try:
+            offers_iter = fetcher.search_prices(
+                origin,
+                dest,
+                departure_at=dep_date,
+                return_at=None,
+                currency=cfg.currency,
+            )
+        except Exception as exc:
+            logger.warning("  Failed to fetch %s->%s: %s", origin, dest, exc)
+            continue
+
+        for off in offers_iter:
+            # ── Filtry wstępne ────────────────────────────
+            if off.stops > cfg.max_stops:
+                continue
+
+            if off.max_layover_h and off.max_layover_h > cfg.max_layover_h:
+                continue
+
+            days = travel_days(off.depart_date, off.return_date)
+            if days and (
+                days < cfg.min_trip_days or days > cfg.max_trip_days
+            ):
+                continue
 
-    for origin in cfg.origins or []:
-        for dest in cfg.destinations or []:
-            logger.info("Fetching: %s ➔ %s", origin, dest)
-            try:
-                offers_iter = fetcher.search_prices(
-                    origin,
-                    dest,
-                    departure_at=dep_date,
-                    return_at=None,
-                    currency=cfg.currency,
+            # ── STEAL? ───────────────────────────────────
+            msg = None
+            if is_offer_steal(off, offer_limits):
+                avg = (
+                    get_last_30d_avg(off.origin, off.destination)
+                    or off.price_pln
                 )
-            except Exception as exc:
-                logger.warning(
-                    "  Failed to fetch %s->%s: %s", origin, dest, exc
+                diff_pct = int(100 * (1 - off.price_pln / Decimal(avg)))
+                msg = (
+                    f"✈️ STEAL!\n"
+                    f"{off.origin} ➔ {off.destination}\n"
+                    f"{off.depart_date} – {off.return_date or 'OW'}\n"
+                    f"{off.price_pln} PLN — -{diff_pct}% "
+                    f"vs średnia 30 dni\n"
+                    f"[Rezerwuj]({off.deep_link})"
                 )
-                continue
 
-            for off in offers_iter:
-                # ── Filtry wstępne ────────────────────────────
-                if off.stops > cfg.max_stops:
-                    continue
-
-                if off.max_layover_h and off.max_layover_h > cfg.max_layover_h:
-                    continue
-
-                days = travel_days(off.depart_date, off.return_date)
-                if days and (
-                    days < cfg.min_trip_days or days > cfg.max_trip_days
-                ):
-                    continue
-
-                # ── Zapis do bazy ────────────────────────────
-                offer_id = insert_offer(off, db_path=DB_FILE)
-                total_inserted.append(offer_id)
-
-                # ── Parowanie OW ────────────────────────────
-                pair_steals = process_outbound(off, offer_id)
-                if pair_steals:
-                    logger.info("Utworzono %d STEAL par", len(pair_steals))
-
-                # ── STEAL? ───────────────────────────────────
-                if is_weekday_steal(off, cfg):
-                    avg = (
-                        get_last_30d_avg(off.origin, off.destination)
-                        or off.price_pln
-                    )
-                    diff_pct = int(100 * (1 - off.price_pln / Decimal(avg)))
-                    msg = (
-                        f"✈️ STEAL!\n"
-                        f"{off.origin} ➔ {off.destination}\n"
-                        f"{off.depart_date} – {off.return_date or 'OW'}\n"
-                        f"{off.price_pln} PLN — -{diff_pct}% "
-                        f"vs średnia 30 dni\n"
-                        f"[Rezerwuj]({off.deep_link})"
-                    )
-                    send_telegram(msg)
-                    mark_alert_sent(offer_id, db_path=DB_FILE)
+            # ── Zapis do bazy (alert w tej samej transakcji) ──
+            offer_id = insert_offer(off, db_path=DB_FILE, alert_text=msg)
+            total_inserted.append(offer_id)
+
+        # Wysyłka w tle, bez czekania na Telegram
+        deliver_alerts()
 
     logger.info("Inserted %s offers into DB", len(total_inserted))
 
+    # ── Parowanie OW (jednym zapytaniem dla całego cyklu) ────
+    pair_steals = process_run(first_id)
+    if pair_steals:
+        logger.info("Utworzono %d STEAL par", len(pair_steals))
+
+    # ── Anomalie względem krzywej cena/dystans (wszystkie trasy) ────
+    anomaly_z = getattr(cfg, "anomaly_z", 0)
+    if anomaly_z:
+        anomalies = detect_anomalies(DB_FILE, since_id=first_id, z=anomaly_z)
+        with transaction(DB_FILE) as conn:
+            for a in anomalies:
+                # Ten sam klucz co alert STEAL – jeden alert na ofertę
+                enqueue_alert(
+                    conn,
+                    "offer",
+                    a.offer_id,
+                    f"📉 ANOMALIA\n"
+                    f"{a.origin} ➔ {a.destination} {a.depart_date}\n"
+                    f"{a.price:.0f} PLN — -{100 * a.discount:.0f}% "
+                    f"vs oczekiwane {a.expected_price:.0f} PLN",
+                    # Nowe trasy nie mają średniej 30 dni – priorytet z modelu
+                    discount=a.discount,
+                )
+
+    # Alerty wysyłały się w tle podczas pobierania; koniec cyklu zamyka
+    # okno zbierania digestów i dociąga kolejkę
+    deliver_alerts(window_s=0)
+    flush_telegram()
+
+    # ── Czas do alertu dla najlepszych okazji cyklu ────
+    top = alert_latencies(DB_FILE, since=cycle_start, top=5)
+    if top:
+        logger.info(
+            "Time-to-alert (top %d): %s",
+            len(top),
+            ", ".join(
+                f"-{100 * disc:.0f}% {sec:.1f}s" for _, disc, sec in top
+            ),
+        )
+
 
 def main() -> None:
     try:
@@ -147,35 +206,75 @@ def run(once: bool, date: Optional[str]) -> None:
 def fetch(date: Optional[str]) -> None:
     """Fetch offers only and print them."""
     migrate(db_path=DB_FILE)
-    for origin in cfg.origins or []:
-        for dest in cfg.destinations or []:
-            logger.info("Fetching: %s ➔ %s", origin, dest)
-            try:
-                offers = fetcher.search_prices(
-                    origin,
-                    dest,
-                    departure_at=date,
-                    return_at=None,
-                    currency=cfg.currency,
-                )
-            except Exception as exc:
-                logger.warning(
-                    "  Failed to fetch %s->%s: %s", origin, dest, exc
-                )
-                continue
-            for off in offers:
-                click.echo(off)
+    for origin, dest in _fetch_plan():
+        logger.info("Fetching: %s ➔ %s", origin, dest)
+        try:
+            offers = fetcher.search_prices(
+                origin,
+                dest,
+                departure_at=date,
+                return_at=None,
+                currency=cfg.currency,
+            )
+        except Exception as exc:
+            logger.warning("  Failed to fetch %s->%s: %s", origin, dest, exc)
+            continue
+        for off in offers:
+            click.echo(off)
 
 
 @cli.command()
-def report() -> None:
+@click.option(
+    "--workers",
+    type=int,
+    default=0,
+    help="Aggregate route shards on this many processes (0 = serial)",
+)
+@click.option(
+    "--memory-mb",
+    type=int,
+    default=0,
+    help="Stream history in chunks within this memory budget (0 = off)",
+)
+def report(workers: int, memory_mb: int) -> None:
     """Aggregate history and send daily report."""
     migrate(db_path=DB_FILE)
 
-    aggregator.aggregate()
-    aggregator.store_weekday_averages()
+    if workers:
+        aggregator.aggregate_parallel(workers=workers)
+    elif memory_mb:
+        aggregator.aggregate_streaming(memory_mb=memory_mb)
+    else:
+        aggregator.aggregate()
+        aggregator.store_weekday_averages()
+    refresh_thresholds()
     daily_report.send_daily_report()
 
 
+@cli.command()
+def backfill() -> None:
+    """Rebuild the route_daily_min summary from offers_raw."""
+    migrate(db_path=DB_FILE)
+    rows = backfill_daily_min(db_path=DB_FILE)
+    click.echo(f"route_daily_min: {rows} rows")
+
+
+@cli.command()
+@click.option("--hours", type=int, default=24, help="Offer age window")
+@click.option("--hub", "hubs", multiple=True, help="Restrict to these hubs")
+@click.option("--limit", type=int, default=20, help="Rows to print")
+def connections(hours: int, hubs: tuple, limit: int) -> None:
+    """List self-transfer itineraries cheaper than the direct fare."""
+    found = find_self_transfers(
+        db_path=DB_FILE, hours=hours, hubs=hubs or None
+    )
+    for c in found[:limit]:
+        click.echo(
+            f"{c.origin}→{c.hub}→{c.destination} {c.depart_date}"
+            f"/{c.connect_date}: {c.price_total:.0f} PLN "
+            f"(direct {c.direct_price:.0f}, -{c.saving:.0f})"
+        )
+
+
 if __name__ == "__main__":
     cli()
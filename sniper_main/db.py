@@ -1,12 +1,14 @@
 from __future__ import annotations
 
+import json
 import logging
 import os
 import sqlite3
 import pathlib
-from datetime import datetime, timezone
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
 from decimal import Decimal
-from typing import Optional, List, Tuple
+from typing import Callable, Dict, Iterator, Optional, List, Tuple
 
 from .models import FlightOffer
 
@@ -28,6 +30,9 @@ def migrate(
     mig_dir = pathlib.Path(migrations_dir)
     scripts = sorted(mig_dir.glob("*.sql"))
     with sqlite3.connect(db_path) as conn:
+        # WAL lets readers keep going while a writer (e.g. a weekday_avg
+        # swap) holds the write lock.
+        conn.execute("PRAGMA journal_mode=WAL")
         conn.execute(
             "CREATE TABLE IF NOT EXISTS schema_version "
             "(version INTEGER PRIMARY KEY)"
@@ -66,8 +71,46 @@ def init_db(
     migrate(db_path=db_path, migrations_dir=migrations_dir)
 
 
-def insert_offer(offer: FlightOffer, db_path: str = DB_FILE) -> int:
-    """Insert *offer* into ``offers_raw`` and return its row id."""
+def parse_day(value: object) -> Optional[date]:
+    """Date part of a stored ``depart_date``; ``None`` if it is malformed.
+
+    Readers skip such rows instead of letting one bad value abort a run.
+    """
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+@contextmanager
+def transaction(db_path: str = DB_FILE) -> Iterator[sqlite3.Connection]:
+    """Yield a connection wrapped in a single ``BEGIN IMMEDIATE`` transaction.
+
+    Commits when the block exits normally and rolls back on any exception.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def insert_offer(
+    offer: FlightOffer,
+    db_path: str = DB_FILE,
+    alert_text: Optional[str] = None,
+) -> int:
+    """Insert *offer* into ``offers_raw`` and return its row id.
+
+    With *alert_text* the offer's alert is queued in ``alerts_outbox`` in
+    the same transaction (once per offer, also for a re-fetched one).
+    """
     logger.info(
         "Inserting offer %s ➔ %s on %s",
         offer.origin,
@@ -98,6 +141,8 @@ def insert_offer(offer: FlightOffer, db_path: str = DB_FILE) -> int:
         )
         existing = cur.fetchone()
         if existing:
+            if alert_text is not None:
+                enqueue_alert(conn, "offer", existing[0], alert_text)
             return existing[0]
 
         cur.execute(
@@ -132,11 +177,114 @@ def insert_offer(offer: FlightOffer, db_path: str = DB_FILE) -> int:
                 int(offer.alert_sent),
             ),
         )
-        conn.commit()
         row_id = cur.lastrowid
+        if alert_text is not None:
+            enqueue_alert(conn, "offer", row_id, alert_text)
+        conn.commit()
         return row_id
 
 
+# Report columns of the announced offer / pair are copied into the outbox
+# row, so the daily report does not have to look them up again.  The
+# discount is against the route's 30-day average; without history the
+# caller's own estimate (:discount, may be NULL) is stored instead.
+# Timestamps keep milliseconds for time-to-alert metrics.
+_ENQUEUE_OFFER_SQL = """
+INSERT INTO alerts_outbox (
+    idem_key, kind, ref_id, origin, destination,
+    depart_date, return_date, price, deep_link, text,
+    discount, created_at, next_attempt_at
+)
+SELECT :kind || ':' || o.id, :kind, o.id, o.origin, o.destination,
+       o.depart_date, o.return_date, o.price_pln, o.deep_link, :text,
+       COALESCE(1 - o.price_pln / t.avg_price, :discount),
+       strftime('%Y-%m-%d %H:%M:%f', 'now'), datetime('now')
+  FROM offers_raw o
+  LEFT JOIN route_thresholds t
+    ON t.origin = o.origin AND t.destination = o.destination
+ WHERE o.id = :ref_id
+ON CONFLICT(idem_key) DO NOTHING
+"""
+
+_ENQUEUE_PAIR_SQL = """
+INSERT INTO alerts_outbox (
+    idem_key, kind, ref_id, origin, destination,
+    depart_date, return_date, price, text,
+    discount, created_at, next_attempt_at
+)
+SELECT 'pair:' || p.id, 'pair', p.id, p.origin, p.destination,
+       p.depart_date, p.return_date, p.price_total_pln, :text,
+       1 - p.price_total_pln / (tout.avg_price + tin.avg_price),
+       strftime('%Y-%m-%d %H:%M:%f', 'now'), datetime('now')
+  FROM offers_pair p
+  JOIN offers_raw i ON i.id = p.in_id
+  LEFT JOIN route_thresholds tout
+    ON tout.origin = p.origin AND tout.destination = p.destination
+  LEFT JOIN route_thresholds tin
+    ON tin.origin = i.origin AND tin.destination = i.destination
+ WHERE p.id = :ref_id
+ON CONFLICT(idem_key) DO NOTHING
+"""
+
+
+def enqueue_alert(
+    conn: sqlite3.Connection,
+    kind: str,
+    ref_id: int,
+    text: str,
+    *,
+    discount: Optional[float] = None,
+) -> bool:
+    """Queue alert *text* about *ref_id* in ``alerts_outbox`` on *conn*.
+
+    *kind* is ``"pair"`` for ``offers_pair`` rows and ``"offer"`` for
+    ``offers_raw`` rows.  The idempotency key
+    ``"<kind>:<ref_id>"`` makes repeated calls no-ops; returns whether a
+    row was added.  Runs inside the caller's transaction.  For offers on
+    routes without a 30-day average, *discount* (e.g. the anomaly model's
+    estimate) sets the alert's priority.
+    """
+    sql = _ENQUEUE_PAIR_SQL if kind == "pair" else _ENQUEUE_OFFER_SQL
+    cur = conn.execute(
+        sql,
+        {"kind": kind, "ref_id": ref_id, "text": text, "discount": discount},
+    )
+    return cur.rowcount > 0
+
+
+def _enqueue_pair_alerts(
+    conn: sqlite3.Connection,
+    steals: List[Tuple],
+    alert: Optional[Callable[[Tuple], str]],
+) -> None:
+    if alert is None:
+        return
+    for row in steals:
+        enqueue_alert(conn, "pair", row[0], alert(row))
+
+
+def backfill_daily_min(db_path: str = DB_FILE) -> int:
+    """Rebuild ``route_daily_min`` from all of ``offers_raw``.
+
+    The table is normally kept current by the ``trg_offers_daily_min``
+    insert trigger; this is for repairs (e.g. after bulk loads that bypass
+    SQLite or manual edits of ``offers_raw``).  Returns the row count.
+    """
+    logger.info("Backfilling route_daily_min in %s", db_path)
+    with transaction(db_path) as conn:
+        conn.execute("DELETE FROM route_daily_min")
+        cur = conn.execute(
+            """
+            INSERT INTO route_daily_min (origin, destination, day, min_price)
+            SELECT origin, destination, DATE(fetched_at), MIN(price_pln)
+              FROM offers_raw
+             WHERE fetched_at IS NOT NULL AND price_pln IS NOT NULL
+             GROUP BY origin, destination, DATE(fetched_at)
+            """
+        )
+        return cur.rowcount
+
+
 def mark_alert_sent(offer_id: int, db_path: str = DB_FILE) -> None:
     """Mark offer with ``offer_id`` as having an alert sent."""
     logger.info("Marking alert sent for offer %s", offer_id)
@@ -195,10 +343,12 @@ def insert_pair(
     ret: str,
     steal: bool,
     db_path: str = DB_FILE,
+    alert_text: Optional[str] = None,
 ) -> int:
     """Insert a paired one-way offer.
 
-    Return its row id or ``-1`` if duplicate.
+    Return its row id or ``-1`` if duplicate.  *alert_text* is queued in
+    ``alerts_outbox`` with a new pair.
     """
 
     sql = """
@@ -227,36 +377,250 @@ def insert_pair(
             ),
         )
         row = cur.fetchone()
+        if row and alert_text is not None:
+            enqueue_alert(conn, "pair", row[0], alert_text)
         conn.commit()
         return int(row[0]) if row else -1
 
 
-def find_returns(
-    out_offer_id: int,
-    dest: str,
-    orig: str,
-    window_start: str,
-    window_end: str,
+def last_offer_id(db_path: str = DB_FILE) -> int:
+    """Return the highest ``offers_raw.id`` (``0`` for an empty table)."""
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute("SELECT MAX(id) FROM offers_raw").fetchone()
+    return int(row[0] or 0)
+
+
+# Both legs of every candidate pair come from offers_raw; each UNION branch
+# drives from the new legs (rowid range) and probes idx_offers_route for
+# the opposite direction within the trip window.
+_PAIRS_SQL = """
+WITH cand AS (
+    SELECT o.id AS out_id, i.id AS in_id,
+           o.origin, o.destination, o.depart_date,
+           i.depart_date AS return_date,
+           o.price_pln AS price_out, i.price_pln AS price_in
+      FROM offers_raw o
+      JOIN offers_raw i
+        ON i.origin = o.destination AND i.destination = o.origin
+       AND i.depart_date BETWEEN date(o.depart_date, :min_fwd)
+                             AND date(o.depart_date, :max_fwd)
+     WHERE o.id > :first_id AND o.stops <= :max_stops
+       AND i.stops <= :max_stops
+    UNION
+    SELECT o.id, i.id,
+           o.origin, o.destination, o.depart_date,
+           i.depart_date,
+           o.price_pln, i.price_pln
+      FROM offers_raw i
+      JOIN offers_raw o
+        ON o.origin = i.destination AND o.destination = i.origin
+       AND o.depart_date BETWEEN date(i.depart_date, :max_back)
+                             AND date(i.depart_date, :min_back)
+     WHERE i.id > :first_id AND i.stops <= :max_stops
+       AND o.stops <= :max_stops
+)
+INSERT INTO offers_pair (
+    out_id, in_id, origin, destination,
+    depart_date, return_date,
+    price_total_pln, steal_pair, fetched_at
+)
+SELECT c.out_id, c.in_id, c.origin, c.destination,
+       c.depart_date, c.return_date,
+       c.price_out + c.price_in,
+       COALESCE(
+           c.price_out <= ro.pair_limit AND c.price_in <= ri.pair_limit,
+           0
+       ),
+       CURRENT_TIMESTAMP
+  FROM cand c
+  LEFT JOIN route_thresholds ro
+    ON ro.origin = c.origin AND ro.destination = c.destination
+  LEFT JOIN route_thresholds ri
+    ON ri.origin = c.destination AND ri.destination = c.origin
+ WHERE true
+ON CONFLICT(out_id, in_id) DO NOTHING
+RETURNING id, steal_pair
+"""
+
+
+def _steal_pairs(conn: sqlite3.Connection, pair_ids: List[int]) -> List[Tuple]:
+    """Alert details of the pairs in *pair_ids* that (still) exist.
+
+    One query for all ids, rows in the order of *pair_ids*.
+    """
+    if not pair_ids:
+        return []
+    return conn.execute(
+        """
+        SELECT p.id, p.origin, p.destination,
+               p.depart_date, p.return_date,
+               o.price_pln, i.price_pln,
+               i.origin, i.destination
+          FROM json_each(?) j
+          JOIN offers_pair p ON p.id = j.value
+          JOIN offers_raw o ON o.id = p.out_id
+          JOIN offers_raw i ON i.id = p.in_id
+         ORDER BY j.key
+        """,
+        (json.dumps(pair_ids),),
+    ).fetchall()
+
+
+def insert_pairs_since(
+    first_id: int,
+    min_trip_days: int,
+    max_trip_days: int,
     max_stops: int,
     db_path: str = DB_FILE,
+    alert: Optional[Callable[[Tuple], str]] = None,
 ) -> List[Tuple]:
-    """Find return legs for a given offer within a time window."""
-
-    q = """
-    SELECT id, price_pln, departure_at
-      FROM offers_raw
-     WHERE origin      = ?
-       AND destination = ?
-       AND departure_at BETWEEN ? AND ?
-       AND stops <= ?
+    """Pair every offer newer than *first_id* in one set-based statement.
+
+    Builds all (out, in) combinations where at least one leg has
+    ``id > first_id``, the return departs *min_trip_days*–*max_trip_days*
+    after the outbound and both legs have at most *max_stops*.  A pair is
+    a STEAL when both legs are within ``route_thresholds.pair_limit`` of
+    their direction.  Existing pairs are left alone.  Returns ``(pair_id,
+    origin, destination, depart_date, return_date, price_out, price_in)``
+    for the newly inserted STEAL pairs, followed by the return leg's
+    ``origin`` and ``destination`` (they differ from the outbound's for
+    open-jaw pairs).  With *alert*, ``alert(row)`` of every returned row
+    is queued in ``alerts_outbox`` in the same transaction.
+    """
+    logger.info("Pairing offers newer than id %s", first_id)
+    params = {
+        "first_id": first_id,
+        "max_stops": max_stops,
+        "min_fwd": f"+{min_trip_days} days",
+        "max_fwd": f"+{max_trip_days} days",
+        "min_back": f"-{min_trip_days} days",
+        "max_back": f"-{max_trip_days} days",
+    }
+    with transaction(db_path) as conn:
+        inserted = conn.execute(_PAIRS_SQL, params).fetchall()
+        steals = _steal_pairs(
+            conn, [pair_id for pair_id, steal in inserted if steal]
+        )
+        _enqueue_pair_alerts(conn, steals, alert)
+    logger.info(
+        "Inserted %d pairs (%d STEAL)", len(inserted), len(steals)
+    )
+    return steals
+
+
+def load_route_thresholds(
+    db_path: str = DB_FILE,
+) -> Dict[Tuple[str, str], float]:
+    """Return ``{(origin, destination): pair_limit}``.
+
+    Read once per run from ``route_thresholds``; routes without history
+    are absent.
     """
-    logger.info("Searching return legs for offer %s", out_offer_id)
     with sqlite3.connect(db_path) as conn:
         rows = conn.execute(
-            q,
-            (dest, orig, window_start, window_end, max_stops),
+            "SELECT origin, destination, pair_limit FROM route_thresholds"
         ).fetchall()
-        return rows
+    return {(o, d): limit for o, d, limit in rows}
+
+
+def load_offer_thresholds(
+    db_path: str = DB_FILE,
+) -> Dict[Tuple[str, str, int], float]:
+    """Return ``{(origin, destination, weekday): offer_limit}``.
+
+    Read once per run from ``offer_thresholds``; *weekday* is
+    :meth:`date.weekday` of the depart date.  Route-weekdays without
+    history are absent.
+    """
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT origin, destination, weekday, offer_limit "
+            "FROM offer_thresholds"
+        ).fetchall()
+    return {(o, d, w): limit for o, d, w, limit in rows}
+
+
+def routes_since(first_id: int, db_path: str = DB_FILE) -> List[Tuple]:
+    """Return routes ``(origin, destination)`` with offers after *first_id*."""
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT DISTINCT origin, destination FROM offers_raw WHERE id > ?",
+            (first_id,),
+        ).fetchall()
+
+
+def insert_top_pairs(
+    rows: List[Tuple],
+    routes: List[Tuple],
+    keep: int,
+    db_path: str = DB_FILE,
+    alert: Optional[Callable[[Tuple], str]] = None,
+) -> List[Tuple]:
+    """Insert top-K pair *rows* and trim *routes* to *keep* pairs per week.
+
+    *rows* are ``(out_id, in_id, origin, destination, depart_date,
+    return_date, price_out, price_in, steal)``.  After inserting, pairs of
+    each route in *routes* beyond the *keep* cheapest per departure week
+    (``strftime('%Y-%W')``) are deleted, so ``offers_pair`` stays bounded.
+    Only plain round trips (return leg ``destination``→``origin``) are
+    trimmed – open-jaw pairs stored under the same route are left alone –
+    and STEAL pairs are never deleted, since their alerts may be queued.
+    Returns the newly inserted STEAL pairs in the same shape as
+    :func:`insert_pairs_since`, and queues their *alert* the same way.
+    An empty *routes* skips the trimming.
+    """
+    steal_ids = []
+    with transaction(db_path) as conn:
+        for out_id, in_id, origin, dest, dep, ret, p_out, p_in, steal in rows:
+            row = conn.execute(
+                """
+                INSERT INTO offers_pair (
+                    out_id, in_id, origin, destination,
+                    depart_date, return_date,
+                    price_total_pln, steal_pair, fetched_at
+                ) VALUES (?,?,?,?,?,?,?,?,CURRENT_TIMESTAMP)
+                ON CONFLICT(out_id, in_id) DO NOTHING
+                RETURNING id
+                """,
+                (
+                    out_id,
+                    in_id,
+                    origin,
+                    dest,
+                    str(dep),
+                    str(ret),
+                    p_out + p_in,
+                    int(steal),
+                ),
+            ).fetchone()
+            if row and steal:
+                steal_ids.append(row[0])
+        for origin, dest in routes:
+            conn.execute(
+                """
+                DELETE FROM offers_pair
+                 WHERE id IN (
+                    SELECT id FROM (
+                        SELECT p.id, p.steal_pair, ROW_NUMBER() OVER (
+                                   PARTITION BY
+                                       strftime('%Y-%W', p.depart_date),
+                                       i.origin, i.destination
+                                   ORDER BY p.price_total_pln, p.id
+                               ) AS rn
+                          FROM offers_pair p
+                          JOIN offers_raw i ON i.id = p.in_id
+                         WHERE p.origin = ? AND p.destination = ?
+                           AND i.origin = ? AND i.destination = ?
+                    )
+                     WHERE rn > ? AND NOT steal_pair
+                 )
+                """,
+                (origin, dest, dest, origin, keep),
+            )
+        steals = _steal_pairs(conn, steal_ids)
+        _enqueue_pair_alerts(conn, steals, alert)
+    logger.info("Inserted %d top pairs (%d STEAL)", len(rows), len(steals))
+    return steals
 
 
 __all__ = [
@@ -267,5 +631,14 @@ __all__ = [
     "upsert_daily_avg",
     "insert_pair",
     "migrate",
-    "find_returns",
+    "insert_pairs_since",
+    "last_offer_id",
+    "routes_since",
+    "load_route_thresholds",
+    "load_offer_thresholds",
+    "insert_top_pairs",
+    "transaction",
+    "parse_day",
+    "backfill_daily_min",
+    "enqueue_alert",
 ]
@@ -1,13 +1,28 @@
 from __future__ import annotations
 
+from decimal import ROUND_HALF_UP, Decimal
+import math
 from statistics import median
 import sqlite3
-from typing import Mapping, Any, List
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
 from datetime import datetime, timezone, date
 
 import logging
 
-from .geo import distance_km
+import numpy as np
+
+from .db import DB_FILE
+from .geo import distance_km, distance_km_array
 
 logger = logging.getLogger(__name__)
 
@@ -17,31 +32,133 @@ logger = logging.getLogger(__name__)
 # ────────────────────────────────────────────────────────────────
 
 
+Route = Tuple[str, str]
+
+# Limit zmiennych SQLite (32766) / 2 kody na trasę, z zapasem
+_ROUTES_PER_QUERY = 5_000
+
+_CENT = Decimal("0.01")
+
+
+def _baseline_source(conn: sqlite3.Connection) -> str:
+    """Tabela z historią cen: ``route_daily_min``, ``offers_raw`` albo
+    ``flights`` (starsze bazy)."""
+    tables = {
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' "
+            "AND name IN ('route_daily_min', 'offers_raw')"
+        )
+    }
+    if "route_daily_min" in tables:
+        return "route_daily_min"
+    return "offers_raw" if "offers_raw" in tables else "flights"
+
+
+def _baseline_query(source: str, n_routes: int) -> str:
+    """Zapytanie o dzienne minima dla *n_routes* tras jednocześnie."""
+    placeholders = ",".join("(?,?)" for _ in range(n_routes))
+    if source == "route_daily_min":
+        # Minima utrzymywane triggerem – O(dni), a nie O(ofert)
+        return f"""
+            SELECT origin, destination, min_price
+              FROM route_daily_min
+             WHERE (origin, destination) IN (VALUES {placeholders})
+               AND day >= date('now', ?)
+        """
+    price_col = "price_pln" if source == "offers_raw" else "price"
+    return f"""
+        SELECT origin, destination, MIN({price_col})
+          FROM {source}
+         WHERE (origin, destination) IN (VALUES {placeholders})
+           AND date(fetched_at) >= date('now', ?)
+         GROUP BY origin, destination, date(fetched_at)
+    """
+
+
+def load_baselines(
+    db_path: str, routes: Iterable[Route], days: int = 90
+) -> Dict[Route, float]:
+    """Zwróć baseline (medianę dziennych minimów) dla wszystkich *routes*.
+
+    Jedno zapytanie na paczkę do ``_ROUTES_PER_QUERY`` tras zamiast
+    osobnego GROUP BY na trasę; źródło danych sprawdzane jest raz na
+    wywołanie, czyli tylko przy chybieniu :class:`BaselineCache`.  Trasy
+    bez historii dostają ``0.0``.
+    """
+    routes = sorted(set(routes))
+    prices: Dict[Route, List[float]] = {route: [] for route in routes}
+    if not routes:
+        return {}
+    conn = sqlite3.connect(db_path)
+    try:
+        source = _baseline_source(conn)
+        for start in range(0, len(routes), _ROUTES_PER_QUERY):
+            end = start + _ROUTES_PER_QUERY
+            chunk = routes[start:end]
+            params = [code for route in chunk for code in route]
+            params.append(f"-{days} day")
+            rows = conn.execute(_baseline_query(source, len(chunk)), params)
+            for origin, dest, price in rows:
+                if price is not None:
+                    prices[(origin, dest)].append(price)
+    finally:
+        conn.close()
+    return {
+        route: float(median(vals)) if vals else 0.0
+        for route, vals in prices.items()
+    }
+
+
 def compute_baseline(
     db_path: str, origin: str, dest: str, days: int = 90
 ) -> float:
     """Zwróć medianę dziennych minimów cen dla trasy z ostatnich *days* dni."""
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' "
-        "AND name='offers_raw'"
-    )
-    table = "offers_raw" if cur.fetchone() else "flights"
-    price_col = "price_pln" if table == "offers_raw" else "price"
-    query = f"""
-        SELECT MIN({price_col})
-          FROM {table}
-         WHERE origin=? AND destination=?
-           AND date(fetched_at) >= date('now', ?)
-         GROUP BY date(fetched_at)
+    return load_baselines(db_path, [(origin, dest)], days)[(origin, dest)]
+
+
+class BaselineCache:
+    """Baseline'y tras trzymane w pamięci przez *ttl_s* sekund.
+
+    Brakujące lub przeterminowane trasy są doczytywane jednym
+    :func:`load_baselines`, więc ocena tysięcy ofert w cyklu to jedno
+    zapytanie do bazy.
     """
-    cur.execute(query, (origin, dest, f"-{days} day"))
-    prices = [row[0] for row in cur.fetchall() if row[0] is not None]
-    conn.close()
-    if not prices:
-        return 0.0
-    return float(median(prices))
+
+    def __init__(
+        self,
+        db_path: str = DB_FILE,
+        *,
+        ttl_s: float = 900.0,
+        days: int = 90,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        self.days = days
+        self._clock = clock
+        self._values: Dict[Route, Tuple[float, float]] = {}
+
+    def get_many(self, routes: Iterable[Route]) -> Dict[Route, float]:
+        now = self._clock()
+        routes = set(routes)
+        stale = [
+            route
+            for route in routes
+            if route not in self._values
+            or now - self._values[route][1] >= self.ttl_s
+        ]
+        if stale:
+            loaded = load_baselines(self.db_path, stale, self.days)
+            for route, baseline in loaded.items():
+                self._values[route] = (baseline, now)
+        return {route: self._values[route][0] for route in routes}
+
+    def get(self, origin: str, dest: str) -> float:
+        return self.get_many([(origin, dest)])[(origin, dest)]
+
+    def clear(self) -> None:
+        self._values.clear()
 
 
 def compute_deal_score(row: Mapping[str, Any], baseline: float) -> float:
@@ -53,9 +170,14 @@ def compute_deal_score(row: Mapping[str, Any], baseline: float) -> float:
     if price <= 0 or baseline <= 0:
         return 0.0
 
-    origin = row.get("origin", "")
-    dest = row.get("destination", "")
-    dist = distance_km(origin, dest)
+    dist = distance_km(row.get("origin", ""), row.get("destination", ""))
+    return _deal_score(row, baseline, price, dist)
+
+
+def _deal_score(
+    row: Mapping[str, Any], baseline: float, price: float, dist: float
+) -> float:
+    """``compute_deal_score`` z już policzonym dystansem trasy."""
     price_per_km = price / dist if dist else float("inf")
 
     score_price = (baseline - price) / baseline * 100.0
@@ -73,7 +195,18 @@ def compute_deal_score(row: Mapping[str, Any], baseline: float) -> float:
             pass
 
     score = 0.6 * score_price + 0.2 * score_ppk + 0.2 * score_time
-    return round(score, 2)
+    return _round2(score)
+
+
+def _round2(value: float) -> float:
+    """Zaokrąglenie do 0.01 „połówka w górę" na zapisie dziesiętnym.
+
+    Wbudowany ``round`` działa na wartości binarnej (``round(2.675, 2)``
+    daje 2.67); tę samą funkcję stosuje wersja wektorowa.
+    """
+    if not math.isfinite(value):
+        return value
+    return float(Decimal(repr(value)).quantize(_CENT, ROUND_HALF_UP))
 
 
 def is_good(
@@ -95,7 +228,8 @@ def is_good(
     if cfg.get("max_price_per_km") and price_per_km > cfg["max_price_per_km"]:
         return False
 
-    score = compute_deal_score(row, baseline)
+    # Dystans już znany – bez drugiego wyszukiwania lotnisk
+    score = _deal_score(row, baseline, price, dist)
     if score < cfg.get("min_score", 0.0):
         return False
     return True
@@ -139,27 +273,212 @@ def is_good_composite(
 
 
 # ────────────────────────────────────────────────────────────────
-# 2.  „Zaślepki” wymagane przez daily_runner.py
+# 2.  Wersje wektorowe (NumPy) dla kolumn ofert
+# ────────────────────────────────────────────────────────────────
+#
+# Te same reguły co compute_deal_score / is_good / is_good_composite,
+# ale na tablicach: wynik dla wiersza jest identyczny z wersją skalarną.
+# Nieznany kod IATA daje score ``NaN`` i ``False`` w masce (wersja
+# skalarna rzuca ``KeyError``).
+
+
+def _round2_array(values: np.ndarray) -> np.ndarray:
+    """:func:`_round2` po elementach.
+
+    ``np.round`` wystarcza poza okolicą połówki; wartości bliskie ``x.xx5``
+    liczy :func:`_round2`, więc wynik jest identyczny z wersją skalarną.
+    """
+    rounded = np.round(values, 2)
+    with np.errstate(invalid="ignore"):
+        scaled = values * 100.0
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half):
+        rounded[i] = _round2(float(values[i]))
+    return rounded
+
+
+def _depart_days(depart: Iterable[Any]) -> np.ndarray:
+    """Daty wylotu jako ``datetime64[D]``; brak lub błąd → ``NaT``."""
+    arr = np.asarray(depart)
+    if arr.dtype.kind == "M":
+        return arr.astype("datetime64[D]")
+    texts = [str(d)[:10] if d else "NaT" for d in arr]
+    try:
+        return np.array(texts, dtype="datetime64[D]")
+    except ValueError:
+        days = np.empty(len(texts), dtype="datetime64[D]")
+        for i, text in enumerate(texts):
+            try:
+                days[i] = np.datetime64(text, "D")
+            except ValueError:
+                days[i] = np.datetime64("NaT")
+        return days
+
+
+def _scores(
+    price: np.ndarray,
+    dist: np.ndarray,
+    depart: Optional[Iterable[Any]],
+    baseline: np.ndarray,
+    today: Optional[date],
+) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_per_km = np.where(dist != 0, price / dist, np.inf)
+        score_price = (baseline - price) / baseline * 100.0
+        score_ppk = np.where(dist > 0, 5.0 - price_per_km, 0.0)
+
+    score_time = np.zeros_like(price)
+    if depart is not None:
+        days = _depart_days(depart)
+        today = today or datetime.now(timezone.utc).date()
+        known = ~np.isnat(days)
+        days_until = (days[known] - np.datetime64(today, "D")).astype(float)
+        score_time[known] = 10.0 - np.abs(days_until - 30) / 3.0
+
+    score = _round2_array(
+        0.6 * score_price + 0.2 * score_ppk + 0.2 * score_time
+    )
+    score[np.isnan(dist)] = np.nan
+    valid = (price > 0) & (baseline > 0)
+    return np.where(valid, score, 0.0)
+
+
+def compute_deal_scores(
+    price: Iterable[float],
+    origin: Iterable[str],
+    dest: Iterable[str],
+    depart: Optional[Iterable[Any]],
+    baseline: float | Iterable[float],
+    *,
+    today: Optional[date] = None,
+) -> np.ndarray:
+    """Wektor ``compute_deal_score`` dla kolumn ofert.
+
+    *baseline* może być liczbą albo tablicą (baseline trasy każdego
+    wiersza); *today* domyślnie to bieżąca data UTC.
+    """
+    price = np.asarray(price, dtype=float)
+    baseline = np.broadcast_to(np.asarray(baseline, dtype=float), price.shape)
+    dist = distance_km_array(origin, dest)
+    return _scores(price, dist, depart, baseline, today)
+
+
+def is_good_many(
+    price: Iterable[float],
+    origin: Iterable[str],
+    dest: Iterable[str],
+    depart: Optional[Iterable[Any]],
+    baseline: float | Iterable[float],
+    cfg: Mapping[str, Any],
+    *,
+    today: Optional[date] = None,
+) -> np.ndarray:
+    """Maska ``is_good`` dla kolumn ofert."""
+    price = np.asarray(price, dtype=float)
+    baseline = np.broadcast_to(np.asarray(baseline, dtype=float), price.shape)
+    dist = distance_km_array(origin, dest)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_per_km = np.where(dist != 0, price / dist, np.inf)
+
+    mask = (price > 0) & (baseline > 0) & ~np.isnan(dist)
+    if cfg.get("max_price"):
+        mask &= ~(price > cfg["max_price"])
+    if cfg.get("max_price_per_km"):
+        mask &= ~(price_per_km > cfg["max_price_per_km"])
+    score = _scores(price, dist, depart, baseline, today)
+    mask &= ~(score < cfg.get("min_score", 0.0))
+    return mask
+
+
+def is_good_composite_many(
+    price: Iterable[float],
+    origin: Iterable[str],
+    dest: Iterable[str],
+    baseline: float | Iterable[float],
+    cfg: Mapping[str, Any],
+    *,
+    trip_days: Optional[Iterable[Optional[float]]] = None,
+    airline: Optional[Iterable[Optional[str]]] = None,
+) -> np.ndarray:
+    """Maska ``is_good_composite`` dla kolumn ofert.
+
+    Brak *trip_days* (``None`` w wierszu) pomija kryterium długości pobytu,
+    tak jak w wersji skalarnej.
+    """
+    price = np.asarray(price, dtype=float)
+    baseline = np.broadcast_to(np.asarray(baseline, dtype=float), price.shape)
+    dist = distance_km_array(origin, dest)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_per_km = np.where(dist != 0, price / dist, np.inf)
+        diff_pct = (baseline - price) / baseline * 100.0
+
+    mask = (price > 0) & (baseline > 0) & ~np.isnan(dist)
+    if cfg.get("max_price"):
+        mask &= ~(price > cfg["max_price"])
+    if cfg.get("max_price_per_km"):
+        mask &= ~(price_per_km > cfg["max_price_per_km"])
+
+    if trip_days is not None:
+        days = np.array(list(trip_days), dtype=float)
+        if cfg.get("min_trip_days"):
+            mask &= ~(days < cfg["min_trip_days"])
+        if cfg.get("max_trip_days"):
+            mask &= ~(days > cfg["max_trip_days"])
+
+    if cfg.get("excluded_airlines") and airline is not None:
+        airlines = np.array(list(airline), dtype=object)
+        mask &= ~np.isin(airlines, list(cfg["excluded_airlines"]))
+
+    score = 1.5 * diff_pct + (5.0 - price_per_km)
+    mask &= ~(score < cfg.get("min_composite_score", 0.0))
+    return mask
+
+
+# ────────────────────────────────────────────────────────────────
+# 3.  Filtr wsadowy używany przez daily_runner.py
 # ────────────────────────────────────────────────────────────────
 
+_caches: Dict[Tuple[str, float], BaselineCache] = {}
+
 
 def filter_deals_by_score(
-    offers: List[Mapping[str, Any]], cfg: Mapping[str, Any]
+    offers: List[Mapping[str, Any]],
+    cfg: Mapping[str, Any],
+    cache: Optional[BaselineCache] = None,
 ) -> List[Mapping[str, Any]]:
-    """
-    Tymczasowy filtr używany przez daily_runner.py.
+    """Zostaw oferty, których ``compute_deal_score`` ≥ ``cfg["min_score"]``.
 
-    Obecnie po prostu zwraca niezmodyfikowaną listę ofert.
-    Jeżeli zechcesz ponownie wprowadzić szczegółowy scoring,
-    zaimplementuj tu dowolną logikę i zwróć przefiltrowaną listę.
+    Baseline'y wszystkich tras z *offers* pochodzą z *cache* (domyślnie
+    współdzielonego per ``cfg["db_path"]`` i ``cfg["baseline_ttl_s"]``),
+    czyli co najwyżej jedno zapytanie na wywołanie.  Bez ``min_score``
+    lista wraca bez zmian; oferty z nieznanym lotniskiem są odrzucane.
     """
-    # Przykład użycia compute_deal_score():
-    # baseline = compute_baseline(
-    #     DB_FILE, offer["origin"], offer["destination"]
-    # )
-    # if compute_deal_score(offer, baseline) >= cfg["min_score"]:
-    #     keep…
-    return offers
+    min_score = cfg.get("min_score")
+    if min_score is None or not offers:
+        return offers
+
+    if cache is None:
+        key = (
+            cfg.get("db_path", DB_FILE),
+            float(cfg.get("baseline_ttl_s", 900.0)),
+        )
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = BaselineCache(key[0], ttl_s=key[1])
+
+    routes = [(o.get("origin", ""), o.get("destination", "")) for o in offers]
+    baselines = cache.get_many(routes)
+    scores = compute_deal_scores(
+        [float(o.get("price_pln") or o.get("price", 0.0)) for o in offers],
+        [origin for origin, _ in routes],
+        [dest for _, dest in routes],
+        [o.get("depart_date") for o in offers],
+        [baselines[route] for route in routes],
+    )
+    # NaN (nieznane lotnisko) nigdy nie przechodzi porównania
+    kept = [offer for offer, ok in zip(offers, scores >= min_score) if ok]
+    logger.info("Deal filter kept %d of %d offers", len(kept), len(offers))
+    return kept
 
 
 def travel_days(depart_date: date, return_date: date | None) -> int:
@@ -176,14 +495,19 @@ def travel_days(depart_date: date, return_date: date | None) -> int:
 
 
 # ────────────────────────────────────────────────────────────────
-# 3.  Eksport symboli
+# 4.  Eksport symboli
 # ────────────────────────────────────────────────────────────────
 
 __all__ = [
+    "BaselineCache",
+    "load_baselines",
     "compute_baseline",
     "compute_deal_score",
+    "compute_deal_scores",
     "is_good_composite",
+    "is_good_composite_many",
     "is_good",
+    "is_good_many",
     "filter_deals_by_score",
     "travel_days",
 ]
@@ -0,0 +1,285 @@
+"""Background message dispatcher with per-chat rate limiting.
+
+``Dispatcher.submit`` only appends to an in-process queue and returns at
+once; a single worker thread does the sending.  Messages queued for the
+same chat while the worker is busy (or within *batch_window_s*) are
+joined into one message up to Telegram's 4096-character limit.  Each
+chat has a token bucket (Telegram allows roughly one message per second
+per chat, with short bursts), and a shared bucket caps the global rate.
+Failed sends are retried with exponential backoff, honouring a
+``retry_after`` hint on the exception (``telegram.error.RetryAfter``).
+The queue is ordered by the *priority* given to :meth:`Dispatcher.submit`
+(highest first, then arrival), so a backlog never delays the best deals.
+"""
+
+from __future__ import annotations
+
+import logging
+import queue
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects longer message texts
+MAX_MESSAGE_CHARS = 4096
+_SEPARATOR = "\n\n"
+
+
+class TokenBucket:
+    """*rate* tokens per second, holding at most *burst* tokens."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._stamp = clock()
+
+    def delay(self) -> float:
+        """Seconds until one token is available (0 if it is now)."""
+        now = self._clock()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._stamp) * self.rate
+        )
+        self._stamp = now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def take(self) -> None:
+        self._tokens -= 1
+
+
+@dataclass
+class _Message:
+    chat_id: object
+    text: str
+    on_sent: Optional[Callable[[], None]] = None
+    on_failed: Optional[Callable[[BaseException], None]] = None
+
+
+# Queue entries: (-priority, sequence, message); None stops the worker
+_STOP = (float("inf"), -1, None)
+
+
+@dataclass
+class _Batch:
+    chat_id: object
+    parts: List[_Message] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return _SEPARATOR.join(m.text for m in self.parts)
+
+    def fits(self, msg: _Message) -> bool:
+        size = len(self.text) + len(_SEPARATOR) + len(msg.text)
+        return size <= MAX_MESSAGE_CHARS
+
+
+class Dispatcher:
+    """Queue + worker thread delivering messages through *send*.
+
+    *send(chat_id, text)* must block until the message is delivered and
+    raise on failure.  ``on_sent`` / ``on_failed`` callbacks passed to
+    :meth:`submit` run on the worker thread.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[object, str], None],
+        *,
+        per_chat_rate: float = 1.0,
+        per_chat_burst: float = 3.0,
+        global_rate: float = 25.0,
+        max_retries: int = 3,
+        backoff_s: float = 1.0,
+        batch_window_s: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self._send = send
+        self._per_chat_rate = per_chat_rate
+        self._per_chat_burst = per_chat_burst
+        self._max_retries = max_retries
+        self._backoff_s = backoff_s
+        self._batch_window_s = batch_window_s
+        self._clock = clock
+        self._sleep = sleep
+        self._global = TokenBucket(global_rate, global_rate, clock)
+        self._buckets: Dict[object, TokenBucket] = {}
+        self._queue: "queue.PriorityQueue[tuple]" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    # ── producer side ──────────────────────────────────────────
+    def submit(
+        self,
+        chat_id: object,
+        text: str,
+        *,
+        on_sent: Optional[Callable[[], None]] = None,
+        on_failed: Optional[Callable[[BaseException], None]] = None,
+        priority: float = 0.0,
+    ) -> None:
+        """Queue *text* for *chat_id*; never blocks on the network.
+
+        Messages with a higher *priority* are sent first.
+        """
+        self._ensure_worker()
+        self._queue.put(
+            (
+                -priority,
+                next(self._seq),
+                _Message(chat_id, text, on_sent, on_failed),
+            )
+        )
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message was sent or given up on."""
+        if self._worker is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush, then stop the worker thread."""
+        if self._worker is None:
+            return
+        self.flush(timeout)
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+        self._worker = None
+
+    # ── worker side ────────────────────────────────────────────
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="dispatcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            msg = self._queue.get()[2]
+            if msg is None:
+                self._queue.task_done()
+                return
+            taken = [msg]
+            # Gather whatever else arrives within the batching window.
+            deadline = self._clock() + self._batch_window_s
+            while True:
+                try:
+                    entry = self._queue.get(
+                        timeout=max(0.0, deadline - self._clock())
+                    )
+                except queue.Empty:
+                    break
+                if entry[2] is None:
+                    self._queue.put(entry)
+                    self._queue.task_done()
+                    break
+                taken.append(entry[2])
+            try:
+                for batch in _batches(taken):
+                    self._deliver(batch)
+            finally:
+                for _ in taken:
+                    self._queue.task_done()
+
+    def _bucket(self, chat_id: object) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(
+                self._per_chat_rate, self._per_chat_burst, self._clock
+            )
+        return bucket
+
+    def _wait_for_token(self, chat_id: object) -> None:
+        bucket = self._bucket(chat_id)
+        while True:
+            wait = max(bucket.delay(), self._global.delay())
+            if wait <= 0:
+                bucket.take()
+                self._global.take()
+                return
+            self._sleep(wait)
+
+    def _deliver(self, batch: _Batch) -> None:
+        error: Optional[BaseException] = None
+        for attempt in range(self._max_retries + 1):
+            self._wait_for_token(batch.chat_id)
+            try:
+                self._send(batch.chat_id, batch.text)
+            except Exception as exc:  # noqa: BLE001 – retried below
+                error = exc
+                retry_after = getattr(exc, "retry_after", None)
+                wait = (
+                    float(retry_after)
+                    if retry_after is not None
+                    else self._backoff_s * 2**attempt
+                )
+                logger.warning(
+                    "Send to %s failed (attempt %d): %s",
+                    batch.chat_id,
+                    attempt + 1,
+                    exc,
+                )
+                if attempt < self._max_retries:
+                    self._sleep(wait)
+                continue
+            self.sent += len(batch.parts)
+            for msg in batch.parts:
+                if msg.on_sent:
+                    _safe_call(msg.on_sent)
+            return
+
+        self.failed += len(batch.parts)
+        logger.error(
+            "Dropping %d message(s) to %s after %d attempts",
+            len(batch.parts),
+            batch.chat_id,
+            self._max_retries + 1,
+        )
+        for msg in batch.parts:
+            if msg.on_failed:
+                _safe_call(msg.on_failed, error)
+
+
+def _batches(messages: List[_Message]) -> List[_Batch]:
+    """Join messages per chat, in arrival order, within the size limit."""
+    open_batches: Dict[object, _Batch] = {}
+    batches: List[_Batch] = []
+    for msg in messages:
+        batch = open_batches.get(msg.chat_id)
+        if batch is None or not batch.fits(msg):
+            batch = open_batches[msg.chat_id] = _Batch(msg.chat_id)
+            batches.append(batch)
+        batch.parts.append(msg)
+    return batches
+
+
+def _safe_call(callback: Callable, *args: object) -> None:
+    try:
+        callback(*args)
+    except Exception:  # noqa: BLE001 – never kill the worker
+        logger.exception("Dispatcher callback failed")
+
+
+__all__ = ["Dispatcher", "TokenBucket", "MAX_MESSAGE_CHARS"]
@@ -0,0 +1,125 @@
+"""Fetch planning: expand watched airports to their neighbours.
+
+Watchlists name the airports a user cares about; with an expansion
+radius each one also pulls in nearby airports from :mod:`geo` (nearest
+first, capped per code).  Expansions that overlap – WAW and WMI both
+within reach of each other – are merged, so every airport and every
+route is fetched once per cycle.
+
+Every added airport is a paid query, so neighbours are real airports
+only: metropolitan city codes (ROM, MIL) and airports a watched city
+code already covers (FCO when ROM is watched) are never added, and a
+*served* list restricts the candidates further, e.g. to airports with
+scheduled service rather than every airfield in the table.
+"""
+
+from __future__ import annotations
+
+import logging
+from itertools import product
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+from .geo import airports_within, distance_matrix, metro_areas
+
+logger = logging.getLogger(__name__)
+
+
+def expand_airports(
+    codes: Iterable[str],
+    radius_km: float,
+    max_extra: int = 3,
+    *,
+    served: Optional[Collection[str]] = None,
+) -> List[str]:
+    """Return *codes* plus up to *max_extra* neighbours within *radius_km*
+    of each, deduplicated; listed codes come first, in their order.
+
+    Neighbours skip metropolitan city codes and airports of a watched
+    city code; with *served* only those codes can be added.  Unknown
+    codes are kept as they are (the fetcher may still know them).
+    """
+    codes = [c.upper() for c in codes]
+    expanded: Dict[str, None] = dict.fromkeys(codes)
+    if radius_km <= 0 or max_extra <= 0:
+        return list(expanded)
+
+    metros = metro_areas()
+    skip = {city for city, members in metros.items() if city not in members}
+    skip.update(a for code in codes for a in metros.get(code, ()))
+    allowed = {c.upper() for c in served} if served is not None else None
+    for code in codes:
+        try:
+            near = airports_within(code, radius_km)
+        except KeyError:
+            continue
+        near = [
+            other
+            for other in near
+            if other != code
+            and other not in skip
+            and (allowed is None or other in allowed)
+        ]
+        expanded.update(dict.fromkeys(near[:max_extra]))
+    return list(expanded)
+
+
+def plan_routes(
+    origins: Iterable[str],
+    destinations: Iterable[str],
+    *,
+    radius_km: float = 0.0,
+    max_extra: int = 3,
+    served: Optional[Collection[str]] = None,
+) -> List[Tuple[str, str]]:
+    """Routes to fetch this cycle: expanded origins × expanded destinations.
+
+    Every route appears once even when expansions overlap.  Routes whose
+    ends are the same airport are dropped, as are routes added by the
+    expansion whose ends lie within *radius_km* of each other (e.g. WAW →
+    WMI) – they cost an API call and never pair.  Watchlist routes are
+    kept whatever their length (WAW → KRK with a 300 km radius).
+    """
+    origins = list(origins)
+    destinations = list(destinations)
+    exp_origins = expand_airports(
+        origins, radius_km, max_extra, served=served
+    )
+    exp_dests = expand_airports(
+        destinations, radius_km, max_extra, served=served
+    )
+
+    candidates = [
+        (origin, dest)
+        for origin in exp_origins
+        for dest in exp_dests
+        if origin != dest
+    ]
+    if radius_km > 0 and candidates:
+        # Disk-cached matrix of the expanded watchlist: later cycles with
+        # the same watchlist only load it.
+        km = distance_matrix(exp_origins, exp_dests).lookup(
+            [origin for origin, _ in candidates],
+            [dest for _, dest in candidates],
+        )
+        # Unknown codes give NaN, which is never "too close".
+        watchlist = set(product(origins, destinations))
+        candidates = [
+            route
+            for route, d in zip(candidates, km)
+            if route in watchlist or not d < radius_km
+        ]
+    routes: Dict[Tuple[str, str], None] = dict.fromkeys(candidates)
+
+    logger.info(
+        "Fetch plan: %d routes (%d origins × %d destinations, watchlist "
+        "%d × %d)",
+        len(routes),
+        len(exp_origins),
+        len(exp_dests),
+        len(origins),
+        len(destinations),
+    )
+    return list(routes)
+
+
+__all__ = ["expand_airports", "plan_routes"]
@@ -0,0 +1,407 @@
+"""In-memory index of one-way legs used by the pair engine.
+
+Legs are grouped per ``(origin, destination)`` and kept sorted by
+departure date, so all return candidates inside a trip window are found
+with two ``bisect`` calls and no database access.  The same date order
+drives the top-K pairing, which slides the trip window over the return
+legs instead of materialising every combination.
+
+:func:`pair_routes` runs that pairing per route on a process pool: each
+worker loads only its shard of routes from a read-only connection and
+returns pair rows, which the caller writes from a single process.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import sqlite3
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .db import DB_FILE, parse_day
+
+logger = logging.getLogger(__name__)
+
+# Fresh interpreters for pairing workers; forking the multi-threaded
+# runner could copy a held lock into the child.
+_SPAWN = multiprocessing.get_context("spawn")
+
+# (depart ordinal, price, id)
+Leg = Tuple[int, float, int]
+# (out_id, in_id, out depart, in depart, price_out, price_in)
+Pair = Tuple[int, int, date, date, float, float]
+Route = Tuple[str, str]
+
+
+@dataclass(slots=True)
+class _RouteLegs:
+    """Parallel arrays sorted by ``days`` (departure as date ordinal)."""
+
+    days: List[int] = field(default_factory=list)
+    prices: List[float] = field(default_factory=list)
+    ids: List[int] = field(default_factory=list)
+    stops: List[int] = field(default_factory=list)
+
+    def append(self, day: int, price: float, leg_id: int, stops: int) -> None:
+        self.days.append(day)
+        self.prices.append(price)
+        self.ids.append(leg_id)
+        self.stops.append(stops)
+
+    def span(self, start: int, end: int) -> Tuple[int, int]:
+        return bisect_left(self.days, start), bisect_right(self.days, end)
+
+
+class LegIndex:
+    """Date-sorted legs per route; see module docstring."""
+
+    def __init__(self) -> None:
+        self._routes: Dict[Tuple[str, str], _RouteLegs] = {}
+        self._route_of: Dict[int, Tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._route_of)
+
+    def __contains__(self, route: object) -> bool:
+        return route in self._routes
+
+    def route_of(self, leg_id: int) -> Tuple[str, str]:
+        """Return ``(origin, destination)`` of an indexed leg."""
+        return self._route_of[leg_id]
+
+    @classmethod
+    def from_db(
+        cls,
+        db_path: str = DB_FILE,
+        *,
+        since: Optional[date] = None,
+        routes: Optional[Sequence[Route]] = None,
+        read_only: bool = False,
+    ) -> "LegIndex":
+        """Load every leg departing on or after *since* (default: today).
+
+        With *routes* only legs of those ``(origin, destination)`` pairs
+        are loaded; *read_only* opens the database with ``mode=ro``.
+        """
+        since = since or date.today()
+        sql = """
+            SELECT id, origin, destination, depart_date, price_pln, stops
+              FROM offers_raw
+             WHERE depart_date >= ?
+        """
+        params: List[object] = [since.isoformat()]
+        if routes is not None:
+            if not routes:
+                return cls()
+            # One JSON parameter instead of two per route: open-jaw runs
+            # can pass more routes than SQLite allows bound variables.
+            sql += """
+               AND (origin, destination) IN (
+                    SELECT json_extract(value, '$[0]'),
+                           json_extract(value, '$[1]')
+                      FROM json_each(?)
+               )
+            """
+            params.append(json.dumps([list(route) for route in routes]))
+        conn = _connect(db_path, read_only)
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        parsed = [
+            (leg_id, origin, dest, parse_day(depart), price, stops)
+            for leg_id, origin, dest, depart, price, stops in rows
+        ]
+        # Malformed depart dates are skipped, not fatal for the whole run
+        index = cls.from_rows(row for row in parsed if row[3] is not None)
+        skipped = sum(row[3] is None for row in parsed)
+        if skipped:
+            logger.warning("Skipped %d legs with a bad depart_date", skipped)
+        logger.info("Loaded %d legs into the leg index", len(index))
+        return index
+
+    @classmethod
+    def from_rows(
+        cls, rows: Iterable[Tuple[int, str, str, date, float, int]]
+    ) -> "LegIndex":
+        """Build an index from ``(id, origin, dest, depart, price, stops)``.
+
+        The index is immutable once built: the pair engine pairs a whole
+        fetch cycle in one batch (:func:`pair_engine.process_run`) and
+        builds a fresh index for it, so there is no incremental insert.
+        """
+        index = cls()
+        for leg_id, origin, dest, depart, price, stops in sorted(
+            rows, key=lambda r: (r[3], r[0])
+        ):
+            if leg_id in index._route_of:
+                continue
+            index._route_of[leg_id] = (origin, dest)
+            legs = index._routes.setdefault((origin, dest), _RouteLegs())
+            legs.append(depart.toordinal(), float(price), leg_id, stops or 0)
+        return index
+
+    def window(
+        self,
+        origin: str,
+        dest: str,
+        start: date,
+        end: date,
+        max_stops: int,
+    ) -> List[Tuple[int, float, date]]:
+        """Return ``(id, price, depart)`` of legs departing in [start, end].
+
+        Legs with more than *max_stops* stops are skipped; the result is
+        ordered by departure date.
+        """
+        legs = self._routes.get((origin, dest))
+        if legs is None:
+            return []
+        lo, hi = legs.span(start.toordinal(), end.toordinal())
+        return [
+            (legs.ids[i], legs.prices[i], date.fromordinal(legs.days[i]))
+            for i in range(lo, hi)
+            if legs.stops[i] <= max_stops
+        ]
+
+    def legs(self, origin: str, dest: str, max_stops: int) -> List[Leg]:
+        """All legs of a route as date-sorted ``(day, price, id)``."""
+        legs = self._routes.get((origin, dest))
+        if legs is None:
+            return []
+        return [
+            (legs.days[i], legs.prices[i], legs.ids[i])
+            for i in range(len(legs.days))
+            if legs.stops[i] <= max_stops
+        ]
+
+    def legs_between(
+        self,
+        origins: Iterable[str],
+        dests: Iterable[str],
+        max_stops: int,
+        exclude: Optional[Tuple[str, str]] = None,
+    ) -> List[Leg]:
+        """Date-sorted legs of every indexed route *origins* × *dests*."""
+        dests = list(dests)
+        runs = [
+            self.legs(origin, dest, max_stops)
+            for origin in origins
+            for dest in dests
+            if (origin, dest) in self._routes and (origin, dest) != exclude
+        ]
+        return list(heapq.merge(*runs))
+
+    def top_k_pairs(
+        self,
+        origin: str,
+        dest: str,
+        min_days: int,
+        max_days: int,
+        max_stops: int,
+        k: int,
+    ) -> List[Pair]:
+        """K cheapest pairs per departure week for ``origin``→``dest``."""
+        returns = top_k_returns(
+            self.legs(origin, dest, max_stops),
+            self.legs(dest, origin, max_stops),
+            min_days,
+            max_days,
+            k,
+        )
+        return top_k_per_week(returns, k)
+
+
+def top_k_returns(
+    outs: Sequence[Leg],
+    ins: Sequence[Leg],
+    min_days: int,
+    max_days: int,
+    k: int,
+) -> List[Pair]:
+    """For every outbound keep only the *k* cheapest returns in its window.
+
+    Both inputs must be sorted by day.  As outbound dates increase, the
+    window ``[day + min_days, day + max_days]`` only moves forward: returns
+    enter a price heap once and, after falling behind the window start,
+    are dropped for good when they surface.  Cost is
+    ``O((n + m) log m + n k log m)`` instead of ``O(n m)``.
+    """
+    heap: List[Tuple[float, int, int]] = []
+    pushed = 0
+    pairs: List[Pair] = []
+    for out_day, out_price, out_id in outs:
+        start, end = out_day + min_days, out_day + max_days
+        while pushed < len(ins) and ins[pushed][0] <= end:
+            in_day, in_price, in_id = ins[pushed]
+            heapq.heappush(heap, (in_price, in_day, in_id))
+            pushed += 1
+
+        best = []
+        while heap and len(best) < k:
+            entry = heapq.heappop(heap)
+            if entry[1] >= start:
+                best.append(entry)
+        for entry in best:
+            heapq.heappush(heap, entry)
+
+        out_date = date.fromordinal(out_day)
+        for in_price, in_day, in_id in best:
+            pairs.append(
+                (
+                    out_id,
+                    in_id,
+                    out_date,
+                    date.fromordinal(in_day),
+                    out_price,
+                    in_price,
+                )
+            )
+    return pairs
+
+
+def departure_week(day: date) -> str:
+    """Week bucket of a departure; matches SQLite ``strftime('%Y-%W')``."""
+    return day.strftime("%Y-%W")
+
+
+def top_k_per_week(pairs: Sequence[Pair], k: int) -> List[Pair]:
+    """Keep the *k* cheapest pairs (by total) per outbound departure week."""
+    kept: List[Pair] = []
+    ordered = sorted(pairs, key=lambda p: departure_week(p[2]))
+    for _, week in groupby(ordered, key=lambda p: departure_week(p[2])):
+        kept.extend(heapq.nsmallest(k, week, key=lambda p: p[4] + p[5]))
+    return kept
+
+
+def _connect(db_path: str, read_only: bool) -> sqlite3.Connection:
+    if not read_only:
+        return sqlite3.connect(db_path)
+    uri = pathlib.Path(db_path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+
+def pair_limits(
+    conn: sqlite3.Connection, routes: Sequence[Route]
+) -> Dict[Route, float]:
+    """``route_thresholds.pair_limit`` of *routes*; missing routes absent."""
+    if not routes:
+        return {}
+    placeholders = ",".join("(?,?)" for _ in routes)
+    rows = conn.execute(
+        f"""
+        SELECT origin, destination, pair_limit
+          FROM route_thresholds
+         WHERE (origin, destination) IN (VALUES {placeholders})
+        """,
+        [code for route in routes for code in route],
+    )
+    return {(origin, dest): limit for origin, dest, limit in rows}
+
+
+def _pair_shard(
+    db_path: str,
+    routes: Sequence[Route],
+    min_days: int,
+    max_days: int,
+    max_stops: int,
+    k: int,
+) -> List[Tuple]:
+    """Worker: top-K pair rows for *routes*, read from a read-only DB."""
+    both = sorted({r for o, d in routes for r in ((o, d), (d, o))})
+    index = LegIndex.from_db(db_path, routes=both, read_only=True)
+    conn = _connect(db_path, read_only=True)
+    try:
+        limits = pair_limits(conn, both)
+    finally:
+        conn.close()
+
+    rows = []
+    for origin, dest in routes:
+        lim_out = limits.get((origin, dest))
+        lim_in = limits.get((dest, origin))
+        pairs = index.top_k_pairs(
+            origin, dest, min_days, max_days, max_stops, k
+        )
+        for out_id, in_id, dep, ret, price_out, price_in in pairs:
+            steal = (
+                lim_out is not None
+                and lim_in is not None
+                and price_out <= lim_out
+                and price_in <= lim_in
+            )
+            rows.append(
+                (
+                    out_id,
+                    in_id,
+                    origin,
+                    dest,
+                    dep,
+                    ret,
+                    price_out,
+                    price_in,
+                    steal,
+                )
+            )
+    return rows
+
+
+def pair_routes(
+    db_path: str,
+    routes: Sequence[Route],
+    *,
+    min_days: int,
+    max_days: int,
+    max_stops: int,
+    k: int,
+    workers: Optional[int] = None,
+) -> List[Tuple]:
+    """Top-K pair rows for every route in *routes*.
+
+    Returns rows shaped for :func:`db.insert_top_pairs`; nothing is
+    written.  Routes are split into shards handled by *workers*
+    processes (default: all cores); ``workers=1`` runs in-process.
+    """
+    routes = sorted(set(routes))
+    workers = workers or os.cpu_count() or 1
+    params = (min_days, max_days, max_stops, k)
+    if workers == 1 or len(routes) < 2:
+        return _pair_shard(db_path, routes, *params)
+
+    # More shards than workers evens out skew between busy and quiet routes.
+    n_shards = min(len(routes), workers * 4)
+    shards = [routes[i::n_shards] for i in range(n_shards)]
+    rows: List[Tuple] = []
+    with ProcessPoolExecutor(workers, mp_context=_SPAWN) as pool:
+        futures = [
+            pool.submit(_pair_shard, db_path, shard, *params)
+            for shard in shards
+        ]
+        for future in futures:
+            rows.extend(future.result())
+    logger.info(
+        "Paired %d routes in %d shards on %d workers",
+        len(routes),
+        len(shards),
+        workers,
+    )
+    return rows
+
+
+__all__ = [
+    "LegIndex",
+    "pair_routes",
+    "pair_limits",
+    "top_k_returns",
+    "top_k_per_week",
+    "departure_week",
+]
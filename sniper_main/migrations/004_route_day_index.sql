@@ -0,0 +1,3 @@
+-- covering index for daily minima per route (SQL aggregation engine)
+CREATE INDEX IF NOT EXISTS idx_offers_route_day
+  ON offers_raw (origin, destination, DATE(fetched_at), price_pln);
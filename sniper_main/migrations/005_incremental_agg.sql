@@ -0,0 +1,16 @@
+-- route_daily_min: cheapest offer per route and fetch day
+CREATE TABLE IF NOT EXISTS route_daily_min (
+  origin TEXT,
+  destination TEXT,
+  day DATE,
+  min_price NUMERIC,
+  PRIMARY KEY (origin, destination, day)
+);
+
+-- agg_watermark: last offers_raw.id whose route offers_agg has refreshed
+CREATE TABLE IF NOT EXISTS agg_watermark (
+  origin TEXT,
+  destination TEXT,
+  last_id INTEGER NOT NULL,
+  PRIMARY KEY (origin, destination)
+);
@@ -0,0 +1,3 @@
+-- range pruning of old aggregates (DELETE ... WHERE day < ?)
+CREATE INDEX IF NOT EXISTS idx_offers_agg_day
+  ON offers_agg (day);
@@ -0,0 +1,19 @@
+-- keep route_daily_min current on every offers_raw insert
+CREATE TRIGGER IF NOT EXISTS trg_offers_daily_min
+AFTER INSERT ON offers_raw
+WHEN NEW.fetched_at IS NOT NULL AND NEW.price_pln IS NOT NULL
+BEGIN
+  INSERT INTO route_daily_min (origin, destination, day, min_price)
+  VALUES (NEW.origin, NEW.destination, DATE(NEW.fetched_at), NEW.price_pln)
+  ON CONFLICT(origin, destination, day)
+  DO UPDATE SET min_price = MIN(min_price, excluded.min_price);
+END;
+
+-- backfill from existing history
+INSERT INTO route_daily_min (origin, destination, day, min_price)
+SELECT origin, destination, DATE(fetched_at), MIN(price_pln)
+  FROM offers_raw
+ WHERE fetched_at IS NOT NULL AND price_pln IS NOT NULL
+ GROUP BY origin, destination, DATE(fetched_at)
+ON CONFLICT(origin, destination, day)
+DO UPDATE SET min_price = excluded.min_price;
@@ -0,0 +1,10 @@
+-- Per-direction STEAL limits, materialised from offers_agg by the aggregator
+CREATE TABLE IF NOT EXISTS route_thresholds (
+  origin TEXT,
+  destination TEXT,
+  avg_price REAL NOT NULL,
+  offer_limit REAL NOT NULL,
+  pair_limit REAL NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (origin, destination)
+);
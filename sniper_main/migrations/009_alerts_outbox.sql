@@ -0,0 +1,27 @@
+-- Alerts written in the same transaction as the offer / pair they announce;
+-- outbox.flush_outbox delivers them (at least once) and records the outcome
+CREATE TABLE IF NOT EXISTS alerts_outbox (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  idem_key TEXT NOT NULL UNIQUE,
+  kind TEXT NOT NULL,
+  ref_id INTEGER NOT NULL,
+  origin TEXT,
+  destination TEXT,
+  depart_date TEXT,
+  return_date TEXT,
+  price REAL,
+  deep_link TEXT,
+  text TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at TEXT NOT NULL DEFAULT (datetime('now')),
+  created_at TEXT NOT NULL DEFAULT (datetime('now')),
+  sent_at TEXT,
+  last_error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_due
+  ON alerts_outbox (status, next_attempt_at);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_sent
+  ON alerts_outbox (sent_at);
@@ -0,0 +1,2 @@
+-- Discount vs the route's 30-day average, for priority-ordered delivery
+ALTER TABLE alerts_outbox ADD COLUMN discount REAL;
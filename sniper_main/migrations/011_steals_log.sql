@@ -0,0 +1,45 @@
+-- Append-only log of delivered alerts (offers and pairs) for the report
+CREATE TABLE IF NOT EXISTS steals (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  sent_at TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  ref_id INTEGER NOT NULL,
+  origin TEXT,
+  destination TEXT,
+  depart_date TEXT,
+  return_date TEXT,
+  price REAL,
+  discount REAL,
+  deep_link TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_steals_sent
+  ON steals (sent_at);
+
+-- one row per alert, when the outbox marks it sent
+CREATE TRIGGER IF NOT EXISTS trg_outbox_sent
+AFTER UPDATE OF status ON alerts_outbox
+WHEN NEW.status = 'sent' AND OLD.status != 'sent'
+BEGIN
+  INSERT INTO steals (
+    sent_at, kind, ref_id, origin, destination,
+    depart_date, return_date, price, discount, deep_link
+  )
+  VALUES (
+    COALESCE(NEW.sent_at, strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    NEW.kind, NEW.ref_id, NEW.origin, NEW.destination,
+    NEW.depart_date, NEW.return_date, NEW.price, NEW.discount,
+    NEW.deep_link
+  );
+END;
+
+-- backfill from alerts already delivered
+INSERT INTO steals (
+  sent_at, kind, ref_id, origin, destination,
+  depart_date, return_date, price, discount, deep_link
+)
+SELECT sent_at, kind, ref_id, origin, destination,
+       depart_date, return_date, price, discount, deep_link
+  FROM alerts_outbox
+ WHERE status = 'sent'
+ ORDER BY sent_at;
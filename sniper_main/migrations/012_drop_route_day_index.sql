@@ -0,0 +1,3 @@
+-- route_daily_min (007) replaced every reader of the expression index;
+-- keeping it only slowed down offers_raw inserts
+DROP INDEX IF EXISTS idx_offers_route_day;
@@ -0,0 +1,12 @@
+-- aggregate_incremental always advanced every route to the same id, so
+-- the per-route rows only cost O(routes) writes per poll; keep one row
+CREATE TABLE IF NOT EXISTS agg_watermark_new (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  last_id INTEGER NOT NULL
+);
+
+INSERT INTO agg_watermark_new (id, last_id)
+SELECT 1, MIN(last_id) FROM agg_watermark HAVING COUNT(*) > 0;
+
+DROP TABLE agg_watermark;
+ALTER TABLE agg_watermark_new RENAME TO agg_watermark;
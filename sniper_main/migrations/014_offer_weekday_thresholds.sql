@@ -0,0 +1,28 @@
+-- Single-offer STEAL limits per route and depart weekday (Mon=0):
+-- weekday_avg.avg_price - k * population std of the same prices
+CREATE TABLE IF NOT EXISTS offer_thresholds (
+  origin TEXT,
+  destination TEXT,
+  weekday INTEGER,
+  avg_price REAL NOT NULL,
+  offer_limit REAL NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (origin, destination, weekday)
+);
+
+-- route_thresholds now only carries the pair limit
+CREATE TABLE route_thresholds_new (
+  origin TEXT,
+  destination TEXT,
+  avg_price REAL NOT NULL,
+  pair_limit REAL NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (origin, destination)
+);
+
+INSERT INTO route_thresholds_new
+SELECT origin, destination, avg_price, pair_limit, updated_at
+  FROM route_thresholds;
+
+DROP TABLE route_thresholds;
+ALTER TABLE route_thresholds_new RENAME TO route_thresholds;
@@ -1,8 +1,15 @@
 from telegram import Bot
+import asyncio
+import atexit
 import smtplib
 import ssl
+import threading
 from email.mime.text import MIMEText
+from typing import Callable, Optional, Set
 from .config import Config
+from .db import DB_FILE
+from .dispatcher import Dispatcher
+from .outbox import flush_outbox
 
 import logging
 
@@ -13,15 +20,81 @@ logger = logging.getLogger(__name__)
 
 bot = Bot(token=cfg.telegram_bot_token)
 
+# PTB 20 is async; the dispatcher worker keeps one event loop for all sends
+_loops = threading.local()
 
-def send_telegram(msg: str) -> None:
-    """Send *msg* via Telegram if enabled in configuration."""
+
+def _send_sync(chat_id: object, text: str) -> None:
+    loop = getattr(_loops, "loop", None)
+    if loop is None:
+        loop = _loops.loop = asyncio.new_event_loop()
+    loop.run_until_complete(
+        bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+    )
+
+
+dispatcher = Dispatcher(
+    _send_sync,
+    per_chat_rate=getattr(cfg, "telegram_rate_per_s", 1.0),
+    max_retries=getattr(cfg, "telegram_max_retries", 3),
+)
+atexit.register(dispatcher.flush, 30)
+
+# Outbox ids handed to the dispatcher and not yet reported back
+_in_flight: Set[int] = set()
+
+
+def send_telegram(
+    msg: str,
+    on_sent: Optional[Callable[[], None]] = None,
+    on_failed: Optional[Callable[[BaseException], None]] = None,
+    priority: float = 0.0,
+) -> None:
+    """Queue *msg* for Telegram if enabled in configuration.
+
+    Returns immediately; *on_sent* runs once the message was delivered
+    (right away when instant alerts are disabled), *on_failed* when the
+    dispatcher gave up on it.  Higher *priority* messages go out first.
+    """
     if cfg.telegram_instant:
-        bot.send_message(
-            chat_id=cfg.telegram_chat_id,
-            text=msg,
-            parse_mode="Markdown",
+        dispatcher.submit(
+            cfg.telegram_chat_id,
+            msg,
+            on_sent=on_sent,
+            on_failed=on_failed,
+            priority=priority,
         )
+    elif on_sent is not None:
+        on_sent()
+
+
+def deliver_alerts(
+    db_path: str = DB_FILE, window_s: Optional[float] = None
+) -> int:
+    """Hand due ``alerts_outbox`` rows to the Telegram dispatcher.
+
+    Alerts of a route are coalesced into one digest; *window_s* (default
+    ``alert_digest_window_s``) holds a route's alerts that long first.
+    Alerts still waiting in the dispatcher queue are not claimed again,
+    however long the rate limit keeps them there.
+    """
+    if window_s is None:
+        window_s = getattr(cfg, "alert_digest_window_s", 0)
+    return flush_outbox(
+        send_telegram,
+        db_path,
+        max_attempts=getattr(cfg, "alert_max_attempts", 5),
+        window_s=window_s,
+        top_n=getattr(cfg, "alert_digest_top", 3),
+        horizon_days=getattr(cfg, "alert_horizon_days", 30),
+        proximity_weight=getattr(cfg, "alert_proximity_weight", 1.0),
+        in_flight=_in_flight,
+    )
+
+
+def flush_telegram(timeout: Optional[float] = None) -> bool:
+    """Block until queued Telegram messages are delivered."""
+    return dispatcher.flush(timeout)
 
 
 def send_email_daily(html_body: str) -> None:
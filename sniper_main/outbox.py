@@ -0,0 +1,352 @@
+"""Delivery of queued alerts from ``alerts_outbox``.
+
+Alerts are written by :func:`db.enqueue_alert` in the same transaction
+as the offer or pair they announce, so a crash can no longer lose one.
+:func:`flush_outbox` claims due rows in batches and hands them to a
+sender; each claim pushes ``next_attempt_at`` forward by a lease, so a
+row whose delivery never reports back (e.g. the process died) becomes
+due again once the lease expires – delivery is at least once.  A
+sender's backlog can outlive the lease, so :func:`flush_outbox` keeps
+the ids still waiting for a callback in an *in_flight* set and never
+claims them again while they are queued.  Failed rows are retried with
+exponential backoff and given up on after *max_attempts*.
+
+Alerts of one kind on one route are coalesced: a route's pending alerts
+are held until the oldest is *window_s* old, then go out as a single
+digest of the *top_n* cheapest.  Those are marked ``sent`` (and logged
+in ``steals``); the rest of the group, only counted in the digest, is
+closed as ``digested`` so it is neither resent nor reported as seen.
+
+Due alerts are handed over biggest deal first: by discount against the
+route's 30-day average, boosted for departures within *horizon_days*
+(see :func:`claim_due`).  :func:`alert_latencies` reports the resulting
+time-to-alert.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .db import DB_FILE, transaction
+
+logger = logging.getLogger(__name__)
+
+# send(text, on_sent, on_failed, priority=...) – may deliver asynchronously
+Sender = Callable[..., None]
+
+
+@dataclass(slots=True)
+class PendingAlert:
+    id: int
+    kind: str
+    origin: Optional[str]
+    destination: Optional[str]
+    price: Optional[float]
+    text: str
+    priority: float
+
+
+# priority = discount × (1 + weight × closeness), closeness falling
+# linearly from 1 (departing now) to 0 (*horizon* days or later)
+_CLAIM_SQL = """
+SELECT id, kind, origin, destination, price, text, priority
+  FROM (
+    SELECT a.*,
+           COALESCE(a.discount, 0) * (
+               1 + :weight * MAX(
+                   0.0,
+                   1 - (julianday(a.depart_date) - julianday('now'))
+                       / :horizon
+               )
+           ) AS priority
+      FROM alerts_outbox a
+     WHERE a.status = 'pending'
+       AND a.next_attempt_at <= datetime('now')
+       AND a.id NOT IN (SELECT value FROM json_each(:exclude))
+       AND (
+           SELECT julianday(MIN(b.created_at)) FROM alerts_outbox b
+            WHERE b.status = 'pending' AND b.kind = a.kind
+              AND b.origin IS a.origin
+              AND b.destination IS a.destination
+       ) <= julianday('now', :window)
+  )
+ ORDER BY priority DESC, id
+ LIMIT :limit
+"""
+
+
+def claim_due(
+    db_path: str = DB_FILE,
+    limit: int = 50,
+    lease_s: float = 300,
+    window_s: float = 0,
+    *,
+    horizon_days: float = 30,
+    proximity_weight: float = 1.0,
+    exclude: Iterable[int] = (),
+) -> List[PendingAlert]:
+    """Return up to *limit* due alerts, highest priority first.
+
+    An alert is due once its route has had a pending alert for
+    *window_s* seconds.  Priority is the discount, scaled by up to
+    ``1 + proximity_weight`` for departures sooner than *horizon_days*.
+    The rows count one more attempt and are not due again for *lease_s*
+    seconds unless :func:`mark_failed` reschedules them sooner.  Ids in
+    *exclude* are never returned.
+    """
+    with transaction(db_path) as conn:
+        rows = conn.execute(
+            _CLAIM_SQL,
+            {
+                "window": f"-{int(window_s)} seconds",
+                "limit": limit,
+                "weight": proximity_weight,
+                "horizon": float(horizon_days),
+                "exclude": json.dumps(list(exclude)),
+            },
+        ).fetchall()
+        conn.executemany(
+            """
+            UPDATE alerts_outbox
+               SET attempts = attempts + 1,
+                   next_attempt_at = datetime('now', ?)
+             WHERE id = ?
+            """,
+            [(f"+{int(lease_s)} seconds", row[0]) for row in rows],
+        )
+    return [PendingAlert(*row) for row in rows]
+
+
+def mark_sent(
+    alert_ids: Iterable[int],
+    db_path: str = DB_FILE,
+    *,
+    digested: Iterable[int] = (),
+) -> None:
+    """Record delivered alerts and flag their offers as alerted.
+
+    *digested* are alerts of the same digest that were not rendered in
+    it: they get status ``digested``, which the ``steals`` trigger does
+    not log.
+    """
+    updates = [(alert_id, "sent") for alert_id in alert_ids]
+    updates += [(alert_id, "digested") for alert_id in digested]
+    with transaction(db_path) as conn:
+        for alert_id, status in updates:
+            row = conn.execute(
+                """
+                UPDATE alerts_outbox
+                   SET status = ?,
+                       sent_at = strftime('%Y-%m-%d %H:%M:%f', 'now'),
+                       last_error = NULL
+                 WHERE id = ? AND status NOT IN ('sent', 'digested')
+                RETURNING kind, ref_id
+                """,
+                (status, alert_id),
+            ).fetchone()
+            if row and row[0] != "pair":
+                conn.execute(
+                    "UPDATE offers_raw SET alert_sent = 1 WHERE id = ?",
+                    (row[1],),
+                )
+
+
+def mark_failed(
+    alert_ids: Iterable[int],
+    error: object,
+    db_path: str = DB_FILE,
+    *,
+    max_attempts: int = 5,
+    backoff_s: float = 60,
+) -> None:
+    """Reschedule failed alerts, or give up after *max_attempts*."""
+    with transaction(db_path) as conn:
+        conn.executemany(
+            """
+            UPDATE alerts_outbox
+               SET last_error = :error,
+                   status = CASE WHEN attempts >= :max_attempts
+                                 THEN 'failed' ELSE 'pending' END,
+                   next_attempt_at = datetime(
+                       'now',
+                       printf('+%d seconds',
+                              :backoff * (1 << MAX(attempts - 1, 0)))
+                   )
+             WHERE id = :id AND status = 'pending'
+            """,
+            [
+                {
+                    "id": alert_id,
+                    "error": str(error),
+                    "max_attempts": max_attempts,
+                    "backoff": int(backoff_s),
+                }
+                for alert_id in alert_ids
+            ],
+        )
+
+
+def _shown(alerts: List[PendingAlert], top_n: int) -> List[PendingAlert]:
+    """The alerts :func:`digest` renders: the *top_n* cheapest."""
+    if len(alerts) == 1:
+        return alerts
+    return sorted(
+        alerts, key=lambda a: (a.price is None, a.price or 0, a.id)
+    )[:top_n]
+
+
+def digest(alerts: List[PendingAlert], top_n: int = 3) -> str:
+    """One message for *alerts* of a route: the *top_n* cheapest."""
+    if len(alerts) == 1:
+        return alerts[0].text
+    best = _shown(alerts, top_n)
+    lines = [
+        f"🔥 {best[0].origin} ➔ {best[0].destination} — "
+        f"STEAL ×{len(alerts)}, top {len(best)}:"
+    ]
+    lines += [a.text for a in best]
+    if len(alerts) > len(best):
+        lines.append(f"… i {len(alerts) - len(best)} więcej")
+    return "\n\n".join(lines)
+
+
+def _group(
+    alerts: List[PendingAlert],
+) -> List[List[PendingAlert]]:
+    groups: Dict[Tuple, List[PendingAlert]] = {}
+    for alert in alerts:
+        key = (alert.kind, alert.origin, alert.destination)
+        groups.setdefault(key, []).append(alert)
+    return list(groups.values())
+
+
+def flush_outbox(
+    send: Sender,
+    db_path: str = DB_FILE,
+    *,
+    batch_size: int = 50,
+    lease_s: float = 300,
+    max_attempts: int = 5,
+    backoff_s: float = 60,
+    window_s: float = 0,
+    top_n: int = 3,
+    horizon_days: float = 30,
+    proximity_weight: float = 1.0,
+    in_flight: Optional[Set[int]] = None,
+) -> int:
+    """Hand every due alert to *send*; return how many alerts went out.
+
+    Due alerts are claimed in batches of *batch_size*, coalesced per
+    route (see :func:`digest`) and sent as one message per route, the
+    route with the highest-priority alert first.  *send* gets the text,
+    callbacks recording the outcome for the whole group and the group's
+    ``priority``; it may call the callbacks later from another thread
+    (see :mod:`dispatcher`).
+
+    Pass the same *in_flight* set to every call with an asynchronous
+    *send*: claimed ids stay in it until their callback runs, and later
+    calls skip them even after their lease ran out, so a long sender
+    queue is not claimed – and sent – twice.
+    """
+    if in_flight is None:
+        in_flight = set()
+    claimed: List[PendingAlert] = []
+    while True:
+        rows = claim_due(
+            db_path,
+            batch_size,
+            lease_s,
+            window_s,
+            horizon_days=horizon_days,
+            proximity_weight=proximity_weight,
+            # copy() is atomic; callbacks shrink the set on another thread
+            exclude=in_flight.copy(),
+        )
+        claimed += rows
+        in_flight.update(alert.id for alert in rows)
+        if len(rows) < batch_size:
+            break
+
+    claimed.sort(key=lambda alert: -alert.priority)
+    groups = _group(claimed)
+    for group in groups:
+        ids = [alert.id for alert in group]
+        shown = {alert.id for alert in _shown(group, top_n)}
+
+        def on_sent(ids: List[int] = ids, shown: Set[int] = shown) -> None:
+            try:
+                mark_sent(
+                    [i for i in ids if i in shown],
+                    db_path,
+                    digested=[i for i in ids if i not in shown],
+                )
+            finally:
+                in_flight.difference_update(ids)
+
+        def on_failed(exc: BaseException, ids: List[int] = ids) -> None:
+            logger.warning("Alerts %s not delivered: %s", ids, exc)
+            try:
+                mark_failed(
+                    ids,
+                    exc,
+                    db_path,
+                    max_attempts=max_attempts,
+                    backoff_s=backoff_s,
+                )
+            finally:
+                in_flight.difference_update(ids)
+
+        send(
+            digest(group, top_n),
+            on_sent,
+            on_failed,
+            priority=max(alert.priority for alert in group),
+        )
+    if claimed:
+        logger.info(
+            "Outbox: %d alerts handed over in %d messages",
+            len(claimed),
+            len(groups),
+        )
+    return len(claimed)
+
+
+def alert_latencies(
+    db_path: str = DB_FILE,
+    since: Optional[str] = None,
+    top: Optional[int] = None,
+) -> List[Tuple[int, float, float]]:
+    """Time-to-alert of alerts queued at or after UTC time *since*.
+
+    Returns ``(id, discount, seconds from queueing to delivery)`` for
+    delivered alerts, biggest discount first, the *top* first ones only
+    if given.
+    """
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            """
+            SELECT id, COALESCE(discount, 0),
+                   (julianday(sent_at) - julianday(created_at)) * 86400
+              FROM alerts_outbox
+             WHERE status = 'sent'
+               AND created_at >= COALESCE(?, '')
+             ORDER BY COALESCE(discount, 0) DESC, id
+             LIMIT ?
+            """,
+            (since, -1 if top is None else top),
+        ).fetchall()
+
+
+__all__ = [
+    "PendingAlert",
+    "alert_latencies",
+    "claim_due",
+    "mark_sent",
+    "mark_failed",
+    "digest",
+    "flush_outbox",
+]
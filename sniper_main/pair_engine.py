@@ -2,99 +2,203 @@
 """
 pair_engine – parowanie dwóch niezależnych OW w pseudo-RT.
 Warunek STEAL-pair (strict):
-  price_out <= avg30(out) * (1 - threshold)
+  price_out <= pair_limit(out)
   AND
-  price_in  <= avg30(in)  * (1 - threshold)
+  price_in  <= pair_limit(in)
+gdzie pair_limit = avg30 * (1 - threshold) z tabeli ``route_thresholds``
+(materializowanej przez ``aggregator.store_route_thresholds``).
 """
 
 from __future__ import annotations
-from datetime import timedelta
+from itertools import product
 import logging
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 
+from . import aggregator
 from .config import Config
-from .db import get_last_30d_avg, find_returns, insert_pair
-from .models import FlightOffer
-from .notifier import send_telegram
+from .db import (
+    DB_FILE,
+    insert_pairs_since,
+    insert_top_pairs,
+    load_route_thresholds,
+    routes_since,
+)
+from .geo import airports_within
+from .leg_index import LegIndex, pair_routes, top_k_returns
 
 CFG = Config.from_json()
 
 logger = logging.getLogger(__name__)
 
 
-def process_outbound(out_offer: FlightOffer, out_id: int) -> List[int]:
-    """Buduje pary dla jednego nowego biletu OW; zwraca listę id par STEAL."""
-    if not CFG.combine_ow:
-        return []
-
-    steals_created: List[int] = []
-
-    window_start = out_offer.depart_date + timedelta(days=CFG.min_trip_days)
-    window_end = out_offer.depart_date + timedelta(days=CFG.max_trip_days)
-
-    returns = find_returns(
-        out_offer_id=out_id,
-        dest=out_offer.destination,
-        orig=out_offer.origin,
-        window_start=window_start.isoformat(),
-        window_end=window_end.isoformat(),
-        max_stops=CFG.max_stops,
-    )
-
-    base_thr = (
+def _pair_threshold() -> float:
+    return (
         CFG.pair_steal_threshold
         if CFG.pair_steal_threshold is not None
         else CFG.steal_threshold
     )
 
-    for ret in returns:
-        ret_id, price_in, ret_date = ret
-        price_out = out_offer.price_pln
-
-        avg_out = get_last_30d_avg(out_offer.origin, out_offer.destination)
-        avg_in = get_last_30d_avg(out_offer.destination, out_offer.origin)
-
-        # Brak historii -> nie uznajemy za STEAL
-        if not avg_out or not avg_in:
-            steal = False
-        else:
-            limit_out = avg_out * (1 - base_thr)
-            limit_in = avg_in * (1 - base_thr)
-            steal = (price_out <= limit_out) and (price_in <= limit_in)
-
-        pair_id = insert_pair(
-            out_id=out_id,
-            in_id=ret_id,
-            price_total=price_out + price_in,
-            origin=out_offer.origin,
-            dest=out_offer.destination,
-            depart=out_offer.depart_date.isoformat(),
-            ret=ret_date,
-            steal=steal,
-        )
-        if pair_id != -1:
-            logger.debug(
-                "PAIR %s-%s %s→%s total=%.0f steal=%s",
-                out_offer.origin,
-                out_offer.destination,
-                out_offer.depart_date,
-                ret_date,
-                price_out + price_in,
-                steal,
-            )
 
-        if steal and pair_id != -1 and CFG.alert_pair and CFG.telegram_instant:
+def refresh_thresholds() -> int:
+    """Przelicza ``route_thresholds`` i ``offer_thresholds`` z konfiguracji."""
+    return aggregator.store_route_thresholds(
+        DB_FILE,
+        offer_k=CFG.steal_threshold,
+        pair_threshold=_pair_threshold(),
+    )
+
+
+def process_run(first_id: int) -> List[int]:
+    """Paruje wszystkie oferty nowsze niż *first_id* jednym zapytaniem.
 
-            msg = (
-                "💥 STEAL PAIR\n"
-                f"{out_offer.origin}→{out_offer.destination} "
-                f"{out_offer.depart_date}  "
-                f"{out_offer.destination}→{out_offer.origin} {ret_date}\n"
-                f"OUT {price_out:.0f} PLN | "
-                f"IN {price_in:.0f} PLN | "
-                f"TOTAL {(price_out+price_in):.0f} PLN"
+    Wywoływane raz po cyklu pobierania – parowanie jest wyłącznie
+    wsadowe, bez dopisywania pojedynczych ofert; zwraca listę id nowych
+    par STEAL.  Przy ``pair_mode == "topk"`` zapisywane jest tylko
+    ``pair_top_k`` najtańszych par na trasę i tydzień wylotu.
+    """
+    if not CFG.combine_ow:
+        return []
+
+    # Alerty trafiają do alerts_outbox razem z parami
+    alert = _pair_alert if CFG.alert_pair else None
+    if getattr(CFG, "pair_mode", "all") == "topk":
+        steals = _process_run_topk(first_id, alert)
+    else:
+        steals = insert_pairs_since(
+            first_id,
+            min_trip_days=CFG.min_trip_days,
+            max_trip_days=CFG.max_trip_days,
+            max_stops=CFG.max_stops,
+            alert=alert,
+        )
+    radius = getattr(CFG, "open_jaw_km", 0)
+    if radius:
+        steals += _process_run_open_jaw(
+            first_id, radius, load_route_thresholds(), alert
+        )
+    return [row[0] for row in steals]
+
+
+def _process_run_topk(
+    first_id: int, alert: Optional[Callable[[tuple], str]] = None
+) -> List[tuple]:
+    """Top-K pairing of every route touched by offers after *first_id*.
+
+    Pary liczone są w ``pair_workers`` procesach (0 = wszystkie rdzenie)
+    na migawkach bazy tylko do odczytu; zapis robi wyłącznie ten proces.
+    """
+    k = getattr(CFG, "pair_top_k", 3)
+
+    # Nowa noga X→Y zmienia zarówno pary X→Y (jako wylot), jak i Y→X
+    # (jako powrót).
+    routes = set()
+    for origin, dest in routes_since(first_id):
+        routes.add((origin, dest))
+        routes.add((dest, origin))
+
+    rows = pair_routes(
+        DB_FILE,
+        sorted(routes),
+        min_days=CFG.min_trip_days,
+        max_days=CFG.max_trip_days,
+        max_stops=CFG.max_stops,
+        k=k,
+        workers=getattr(CFG, "pair_workers", 1) or None,
+    )
+    return insert_top_pairs(rows, sorted(routes), keep=k, alert=alert)
+
+
+def _process_run_open_jaw(
+    first_id: int,
+    radius_km: float,
+    thresholds: Dict[Tuple[str, str], float],
+    alert: Optional[Callable[[tuple], str]] = None,
+) -> List[tuple]:
+    """Pary open-jaw: powrót z lotniska do *radius_km* od celu wylotu,
+    lądujący do *radius_km* od miejsca startu (np. WAW→BCN + GRO→WAW).
+
+    Kandydaci na lotniska z indeksu przestrzennego ``geo``; dla każdego
+    wylotu zapisywane jest ``pair_top_k`` najtańszych powrotów.
+    """
+    k = getattr(CFG, "pair_top_k", 3)
+    nearby: Dict[str, List[str]] = {}
+
+    def near(code: str) -> List[str]:
+        if code not in nearby:
+            try:
+                nearby[code] = airports_within(code, radius_km)
+            except KeyError:
+                nearby[code] = [code]
+        return nearby[code]
+
+    # Nowa noga A→B jest wylotem dla trasy A→B albo powrotem dla tras
+    # X→Y, gdzie X leży blisko B, a Y blisko A.
+    routes = set()
+    for origin, dest in routes_since(first_id):
+        routes.add((origin, dest))
+        routes.update(product(near(dest), near(origin)))
+
+    # Indeks tylko z nóg tych tras i ich możliwych powrotów
+    legs = set(routes)
+    for origin, dest in routes:
+        legs.update(product(near(dest), near(origin)))
+    index = LegIndex.from_db(routes=sorted(legs))
+    routes = {route for route in routes if route in index}
+
+    rows = []
+    for origin, dest in sorted(routes):
+        outs = index.legs(origin, dest, CFG.max_stops)
+        ins = index.legs_between(
+            near(dest), near(origin), CFG.max_stops, exclude=(dest, origin)
+        )
+        pairs = top_k_returns(
+            outs, ins, CFG.min_trip_days, CFG.max_trip_days, k
+        )
+        for out_id, in_id, dep, ret, price_out, price_in in pairs:
+            lim_out = thresholds.get((origin, dest))
+            lim_in = thresholds.get(index.route_of(in_id))
+            steal = bool(
+                lim_out is not None
+                and lim_in is not None
+                and price_out <= lim_out
+                and price_in <= lim_in
             )
-            send_telegram(msg)
-            steals_created.append(pair_id)
+            rows.append(
+                (
+                    out_id,
+                    in_id,
+                    origin,
+                    dest,
+                    dep,
+                    ret,
+                    price_out,
+                    price_in,
+                    steal,
+                )
+            )
+    return insert_top_pairs(rows, [], keep=k, alert=alert)
+
+
+def _steal_pair_msg(
+    origin: str,
+    dest: str,
+    depart: object,
+    ret: object,
+    price_out: float,
+    price_in: float,
+    ret_from: Optional[str] = None,
+    ret_to: Optional[str] = None,
+) -> str:
+    return (
+        "💥 STEAL PAIR\n"
+        f"{origin}→{dest} {depart}  "
+        f"{ret_from or dest}→{ret_to or origin} {ret}\n"
+        f"OUT {price_out:.0f} PLN | "
+        f"IN {price_in:.0f} PLN | "
+        f"TOTAL {(price_out+price_in):.0f} PLN"
+    )
+
 
-    return steals_created
+def _pair_alert(row: tuple) -> str:
+    """Treść alertu dla wiersza STEAL z ``insert_pairs_since``."""
+    return _steal_pair_msg(*row[1:])
@@ -1,6 +1,7 @@
 """tasks.py – harmonogram z APScheduler.
 
-• co Config.poll_interval_h – uruchom fetcher + ``daily_runner``
+• co Config.poll_interval_h – uruchom fetcher + ``daily_runner``,
+  a potem przyrostową agregację (``aggregate_incremental``)
 • raz dziennie o 02:00 UTC – ``aggregator`` + e-mail podsumowujący
 """
 
@@ -20,8 +21,9 @@ sched = BlockingScheduler(timezone="UTC")
 
 @sched.scheduled_job("interval", hours=Config.poll_interval_h)
 def fetch_job() -> None:
-    """Fetch new offers and process them."""
+    """Fetch new offers, process them and fold them into averages."""
     daily_runner.main()
+    aggregator.aggregate_incremental()
 
 
 @sched.scheduled_job("cron", hour=2, minute=0)
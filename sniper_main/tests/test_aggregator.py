@@ -2,6 +2,7 @@ import os
 from datetime import datetime, timedelta
 import sqlite3
 
+import pandas as pd
 import pytest
 
 from sniper_main.db import init_db
@@ -99,3 +100,350 @@ def test_compute_weekday_averages(tmp_path):
     conn.close()
     assert db_row is not None
     assert float(db_row[0]) == pytest.approx(150.0)
+
+
+def test_aggregate_sql_engine_matches_pandas(tmp_path):
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    now = datetime.utcnow()
+    results = {}
+    for engine in ("pandas", "sql"):
+        db_file = tmp_path / f"{engine}.db"
+        init_db(str(db_file), migrations_dir=migrations_dir)
+        conn = sqlite3.connect(db_file)
+        for i in range(35):
+            dt = now - timedelta(days=i)
+            for route, base in ((("WAW", "JFK"), 100), (("KRK", "BCN"), 50)):
+                for extra in (0, 25):
+                    conn.execute(
+                        "INSERT INTO offers_raw (origin, destination, "
+                        "price_pln, fetched_at) VALUES (?,?,?,?)",
+                        (*route, base + i + extra, dt.isoformat()),
+                    )
+        conn.commit()
+        conn.close()
+
+        df = aggregator.aggregate(str(db_file), output="df", engine=engine)
+        results[engine] = {
+            (r.origin, r.destination): float(r.mean_price)
+            for r in df.itertuples(index=False)
+        }
+
+        conn = sqlite3.connect(db_file)
+        stored = dict(
+            ((o, d), float(p))
+            for o, d, p in conn.execute(
+                "SELECT origin, destination, mean_price FROM offers_agg"
+            )
+        )
+        conn.close()
+        assert stored == pytest.approx(results[engine])
+
+    assert results["sql"] == pytest.approx(results["pandas"])
+
+
+def test_aggregate_unknown_engine(tmp_path):
+    with pytest.raises(ValueError):
+        aggregator.aggregate(str(tmp_path / "x.db"), engine="polars")
+
+
+def test_aggregate_incremental_matches_full(tmp_path):
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    full_db = tmp_path / "full.db"
+    inc_db = tmp_path / "inc.db"
+    for db_file in (full_db, inc_db):
+        init_db(str(db_file), migrations_dir=migrations_dir)
+
+    now = datetime.utcnow()
+
+    def insert(days):
+        for db_file in (full_db, inc_db):
+            conn = sqlite3.connect(db_file)
+            for i in days:
+                dt = now - timedelta(days=i)
+                for extra in (0, 40):
+                    conn.execute(
+                        "INSERT INTO offers_raw (origin, destination, "
+                        "price_pln, fetched_at) VALUES (?,?,?,?)",
+                        ("WAW", "JFK", 100 + i + extra, dt.isoformat()),
+                    )
+            conn.commit()
+            conn.close()
+
+    def stored(db_file):
+        conn = sqlite3.connect(db_file)
+        row = conn.execute(
+            "SELECT mean_price FROM offers_agg WHERE origin='WAW' "
+            "AND destination='JFK' AND day=DATE('now')"
+        ).fetchone()
+        conn.close()
+        return float(row[0])
+
+    insert(range(10, 35))
+    assert aggregator.aggregate_incremental(str(inc_db)) == 1
+    full = aggregator.aggregate(str(full_db), output="df")
+    assert stored(inc_db) == pytest.approx(float(full["mean_price"][0]))
+
+    # Nothing new -> nothing touched.
+    assert aggregator.aggregate_incremental(str(inc_db)) == 0
+
+    # A cheaper offer for an already aggregated day plus fresh days.
+    insert(range(0, 11))
+    assert aggregator.aggregate_incremental(str(inc_db)) == 1
+    full = aggregator.aggregate(str(full_db), output="df")
+    assert stored(inc_db) == pytest.approx(float(full["mean_price"][0]))
+
+
+def test_aggregate_prunes_old_rows_in_place(tmp_path):
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+
+    today = datetime.utcnow().date()
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "INSERT INTO offers_raw (origin, destination, price_pln, "
+        "fetched_at) VALUES (?,?,?,?)",
+        ("WAW", "JFK", 100, datetime.utcnow().isoformat()),
+    )
+    for age in (61, 10):
+        conn.execute(
+            "INSERT INTO offers_agg VALUES (?,?,?,?)",
+            ("KRK", "BCN", (today - timedelta(days=age)).isoformat(), 50),
+        )
+    conn.commit()
+    conn.close()
+
+    aggregator.aggregate(str(db_file))
+    aggregator.aggregate(str(db_file))
+
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute(
+        "SELECT origin, day FROM offers_agg ORDER BY origin, day"
+    ).fetchall()
+    conn.close()
+    assert rows == [
+        ("KRK", (today - timedelta(days=10)).isoformat()),
+        ("WAW", today.isoformat()),
+    ]
+
+
+def test_store_weekday_averages_swaps_atomically(tmp_path, monkeypatch):
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+
+    def fake_averages(rows):
+        return lambda db_path: pd.DataFrame(
+            rows, columns=["origin", "destination", "weekday", "avg_price"]
+        )
+
+    monkeypatch.setattr(
+        aggregator,
+        "compute_weekday_averages",
+        fake_averages([("WAW", "JFK", 0, 100.0)]),
+    )
+    aggregator.store_weekday_averages(str(db_file))
+
+    # A failing rebuild (duplicate key) must leave the old table intact.
+    monkeypatch.setattr(
+        aggregator,
+        "compute_weekday_averages",
+        fake_averages([("WAW", "JFK", 1, 1.0), ("WAW", "JFK", 1, 2.0)]),
+    )
+    with pytest.raises(sqlite3.IntegrityError):
+        aggregator.store_weekday_averages(str(db_file))
+
+    conn = sqlite3.connect(db_file)
+    tables = {
+        r[0]
+        for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+        )
+    }
+    rows = conn.execute("SELECT * FROM weekday_avg").fetchall()
+    conn.close()
+    assert "weekday_avg_new" not in tables
+    assert rows == [("WAW", "JFK", 0, 100)]
+
+
+def test_aggregate_parallel_matches_sequential(tmp_path):
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    now = datetime.utcnow()
+    dbs = {}
+    for name in ("seq", "par"):
+        db_file = tmp_path / f"{name}.db"
+        init_db(str(db_file), migrations_dir=migrations_dir)
+        conn = sqlite3.connect(db_file)
+        for i in range(60):
+            dt = now - timedelta(days=i)
+            for n, dest in enumerate(("JFK", "BCN", "BKK", "LHR", "MAD")):
+                conn.execute(
+                    "INSERT INTO offers_raw (origin, destination, "
+                    "depart_date, price_pln, fetched_at) VALUES (?,?,?,?,?)",
+                    (
+                        "WAW",
+                        dest,
+                        (dt + timedelta(days=20 + n)).date().isoformat(),
+                        100 + 10 * n + (i * 7) % 23,
+                        dt.isoformat(),
+                    ),
+                )
+        conn.commit()
+        conn.close()
+        dbs[name] = str(db_file)
+
+    aggregator.aggregate(dbs["seq"])
+    aggregator.store_weekday_averages(dbs["seq"])
+    assert aggregator.aggregate_parallel(dbs["par"], workers=2) == 5
+
+    def dump(db_path):
+        conn = sqlite3.connect(db_path)
+        agg = conn.execute(
+            "SELECT origin, destination, day, mean_price FROM offers_agg "
+            "ORDER BY 1, 2"
+        ).fetchall()
+        weekday = conn.execute(
+            "SELECT * FROM weekday_avg ORDER BY 1, 2, 3"
+        ).fetchall()
+        conn.close()
+        return agg, weekday
+
+    assert dump(dbs["par"]) == dump(dbs["seq"])
+
+
+def test_aggregate_streaming_matches_in_memory(tmp_path, monkeypatch):
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    now = datetime.utcnow()
+    dbs = {}
+    for name in ("mem", "stream"):
+        db_file = tmp_path / f"{name}.db"
+        init_db(str(db_file), migrations_dir=migrations_dir)
+        conn = sqlite3.connect(db_file)
+        for i in range(95):
+            dt = now - timedelta(days=i)
+            for n, dest in enumerate(("JFK", "BCN", "BKK")):
+                for extra in (0, 35):
+                    conn.execute(
+                        "INSERT INTO offers_raw (origin, destination, "
+                        "depart_date, price_pln, fetched_at) "
+                        "VALUES (?,?,?,?,?)",
+                        (
+                            "WAW",
+                            dest,
+                            (dt + timedelta(days=3 * n + i % 5)).date()
+                            .isoformat(),
+                            100 + 10 * n + (i * 7) % 23 + extra,
+                            dt.isoformat(),
+                        ),
+                    )
+        conn.commit()
+        conn.close()
+        dbs[name] = str(db_file)
+
+    aggregator.aggregate(dbs["mem"])
+    aggregator.store_weekday_averages(dbs["mem"])
+
+    # Force many tiny chunks.
+    monkeypatch.setattr(aggregator, "_BYTES_PER_ROW", 1024 * 1024 // 10)
+    monkeypatch.setattr(aggregator, "_MIN_CHUNK_ROWS", 1)
+    assert aggregator.aggregate_streaming(dbs["stream"], memory_mb=1) > 0
+
+    def dump(db_path):
+        conn = sqlite3.connect(db_path)
+        agg = conn.execute(
+            "SELECT origin, destination, day, mean_price FROM offers_agg "
+            "ORDER BY 1, 2"
+        ).fetchall()
+        weekday = conn.execute(
+            "SELECT * FROM weekday_avg ORDER BY 1, 2, 3"
+        ).fetchall()
+        conn.close()
+        return agg, weekday
+
+    mem_agg, mem_weekday = dump(dbs["mem"])
+    stream_agg, stream_weekday = dump(dbs["stream"])
+    assert [r[:3] for r in stream_agg] == [r[:3] for r in mem_agg]
+    assert [r[3] for r in stream_agg] == pytest.approx([r[3] for r in mem_agg])
+    assert [r[:3] for r in stream_weekday] == [r[:3] for r in mem_weekday]
+    assert [r[3] for r in stream_weekday] == pytest.approx(
+        [r[3] for r in mem_weekday]
+    )
+
+
+def test_aggregate_streaming_skips_malformed_dates(tmp_path):
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    now = datetime.utcnow()
+    dbs = {}
+    for name in ("mem", "stream"):
+        db_file = tmp_path / f"{name}.db"
+        init_db(str(db_file), migrations_dir=migrations_dir)
+        conn = sqlite3.connect(db_file)
+        for depart, price in (
+            ((now + timedelta(days=1)).date().isoformat(), 100),
+            ("not-a-date", 5),
+            ((now + timedelta(days=2)).date().isoformat(), 200),
+        ):
+            conn.execute(
+                "INSERT INTO offers_raw (origin, destination, depart_date, "
+                "price_pln, fetched_at) VALUES ('WAW','JFK',?,?,?)",
+                (depart, price, now.isoformat()),
+            )
+        conn.commit()
+        conn.close()
+        dbs[name] = str(db_file)
+
+    aggregator.store_weekday_averages(dbs["mem"])
+    assert aggregator.aggregate_streaming(dbs["stream"]) == 3
+
+    def weekdays(db_path):
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute(
+            "SELECT * FROM weekday_avg ORDER BY 1, 2, 3"
+        ).fetchall()
+        conn.close()
+        return rows
+
+    assert weekdays(dbs["stream"]) == weekdays(dbs["mem"])
+    assert sorted(r[3] for r in weekdays(dbs["stream"])) == [100, 200]
@@ -0,0 +1,75 @@
+import os
+import random
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from sniper_main.anomaly import detect_anomalies
+from sniper_main.db import init_db, last_offer_id
+from sniper_main.geo import distance_km
+
+
+def setup_db(tmp_path):
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+    return str(db_file)
+
+
+def add_offers(db_path, offers):
+    conn = sqlite3.connect(db_path)
+    now = datetime.now(timezone.utc).isoformat()
+    for n, (origin, dest, depart, price, stops) in enumerate(offers):
+        conn.execute(
+            "INSERT INTO offers_raw (origin, destination, depart_date, "
+            "price_pln, stops, deep_link, fetched_at) VALUES (?,?,?,?,?,?,?)",
+            (origin, dest, depart, price, stops, f"/{price}/{n}", now),
+        )
+    conn.commit()
+    conn.close()
+
+
+def fare(origin, dest, stops):
+    return 40 * distance_km(origin, dest) ** 0.6 * (1 - 0.1 * stops)
+
+
+def test_flags_offer_far_below_the_curve_on_a_new_route(tmp_path):
+    db_path = setup_db(tmp_path)
+    rnd = random.Random(1)
+    codes = ["WAW", "KRK", "GDN", "BCN", "MAD", "LIS", "FCO", "LHR", "JFK"]
+    depart = (date.today() + timedelta(days=30)).isoformat()
+    history = []
+    for _ in range(400):
+        origin, dest = rnd.sample(codes, 2)
+        stops = rnd.randrange(2)
+        price = fare(origin, dest, stops) * rnd.uniform(0.85, 1.15)
+        history.append((origin, dest, depart, round(price, 2), stops))
+    add_offers(db_path, history)
+
+    first_id = last_offer_id(db_path)
+    cheap = round(fare("WRO", "ATH", 0) * 0.4, 2)
+    add_offers(
+        db_path,
+        [
+            ("WRO", "ATH", depart, cheap, 0),
+            ("WRO", "OPO", depart, round(fare("WRO", "OPO", 0), 2), 0),
+            # A malformed date is skipped, not fatal for the whole model
+            ("WAW", "KRK", "2025-02-30", 1.0, 0),
+        ],
+    )
+
+    found = detect_anomalies(db_path, since_id=first_id)
+    assert [(a.origin, a.destination) for a in found] == [("WRO", "ATH")]
+    assert found[0].offer_id == first_id + 1
+    assert found[0].discount == pytest.approx(0.6, abs=0.1)
+    assert found[0].z <= -3
+
+    assert detect_anomalies(db_path, since_id=first_id + 1) == []
+    assert detect_anomalies(db_path, min_samples=10_000) == []
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+
+from sniper_main.connections import find_self_transfers
+from sniper_main.db import init_db
+
+
+def setup_db(tmp_path, legs, fetched_at=None, name="test.db"):
+    db_file = tmp_path / name
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+    fetched_at = fetched_at or datetime.now(timezone.utc)
+    conn = sqlite3.connect(db_file)
+    for n, (origin, dest, depart, price, total_h) in enumerate(legs):
+        conn.execute(
+            "INSERT INTO offers_raw (origin, destination, depart_date, "
+            "price_pln, stops, total_time_h, deep_link, fetched_at) "
+            "VALUES (?,?,?,?,?,?,?,?)",
+            (
+                origin,
+                dest,
+                depart,
+                price,
+                0,
+                total_h,
+                f"/l{n}",
+                fetched_at.isoformat(),
+            ),
+        )
+    conn.commit()
+    conn.close()
+    return str(db_file)
+
+
+def test_finds_cheaper_self_transfer(tmp_path):
+    db_path = setup_db(
+        tmp_path,
+        [
+            ("HAM", "MUC", "2025-05-03", 500, 1.5),  # direct
+            ("HAM", "FRA", "2025-05-03", 100, 1.0),
+            ("FRA", "MUC", "2025-05-03", 50, 1.0),  # same day: too tight
+            ("FRA", "MUC", "2025-05-04", 150, 1.0),
+            ("FRA", "MUC", "2025-05-05", 120, 1.0),
+            ("FRA", "MUC", "2025-05-09", 10, 1.0),  # beyond layover
+            ("FRA", "MUC", "05/04/2025", 5, 1.0),  # malformed, skipped
+        ],
+    )
+
+    found = find_self_transfers(db_path=db_path, max_layover_days=2)
+
+    assert len(found) == 1
+    c = found[0]
+    assert (c.origin, c.hub, c.destination) == ("HAM", "FRA", "MUC")
+    assert c.depart_date == date(2025, 5, 3)
+    assert c.connect_date == date(2025, 5, 5)
+    assert (c.first_id, c.second_id) == (2, 5)
+    assert c.price_total == 220
+    assert c.saving == 280
+
+
+def test_prunes_by_price_detour_and_age(tmp_path):
+    db_path = setup_db(
+        tmp_path,
+        [
+            ("HAM", "MUC", "2025-05-03", 200, 1.5),
+            ("HAM", "FRA", "2025-05-03", 100, 1.0),
+            ("FRA", "MUC", "2025-05-04", 150, 1.0),  # not below direct
+            ("DUS", "CGN", "2025-05-03", 300, 0.5),
+            ("DUS", "MUC", "2025-05-03", 50, 1.0),
+            ("MUC", "CGN", "2025-05-04", 50, 1.0),  # detour too long
+        ],
+    )
+    assert find_self_transfers(db_path=db_path) == []
+
+    stale = setup_db(
+        tmp_path,
+        [
+            ("HAM", "MUC", "2025-05-03", 500, 1.5),
+            ("HAM", "FRA", "2025-05-03", 100, 1.0),
+            ("FRA", "MUC", "2025-05-04", 100, 1.0),
+        ],
+        fetched_at=datetime.now(timezone.utc) - timedelta(hours=48),
+        name="stale.db",
+    )
+    assert find_self_transfers(db_path=stale, hours=24) == []
+    assert len(find_self_transfers(db_path=stale, hours=72)) == 1
+
+
+def test_hub_filter(tmp_path):
+    db_path = setup_db(
+        tmp_path,
+        [
+            ("HAM", "MUC", "2025-05-03", 500, 1.5),
+            ("HAM", "FRA", "2025-05-03", 100, 1.0),
+            ("FRA", "MUC", "2025-05-04", 100, 1.0),
+        ],
+    )
+    assert find_self_transfers(db_path=db_path, hubs=["STR"]) == []
+    assert len(find_self_transfers(db_path=db_path, hubs=["fra"])) == 1
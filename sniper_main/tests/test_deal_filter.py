@@ -112,3 +112,184 @@ def test_is_good_composite(tmp_path):
         "excluded_airlines": ["FR", "W6"],
     }
     assert not is_good_composite(row_excluded, cfg_ex, baseline)
+
+
+def test_load_baselines_matches_per_route(tmp_path, monkeypatch):
+    from sniper_main import deal_filter
+    from sniper_main.db import init_db
+    from sniper_main.deal_filter import load_baselines
+
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+    now = datetime.now(timezone.utc)
+    conn = sqlite3.connect(db_file)
+    for i, (origin, dest) in enumerate(
+        [("FRA", "HAM"), ("HAM", "FRA"), ("MUC", "DUS")]
+    ):
+        for day in range(5):
+            for price in (100 + 10 * i + day, 300):
+                conn.execute(
+                    "INSERT INTO offers_raw (origin, destination, "
+                    "price_pln, fetched_at) VALUES (?,?,?,?)",
+                    (
+                        origin,
+                        dest,
+                        price,
+                        (now - timedelta(days=day)).isoformat(),
+                    ),
+                )
+    conn.commit()
+    conn.close()
+
+    routes = [("FRA", "HAM"), ("HAM", "FRA"), ("MUC", "DUS"), ("FRA", "STR")]
+    batch = load_baselines(str(db_file), routes)
+    assert batch == {
+        route: compute_baseline(str(db_file), *route) for route in routes
+    }
+    assert batch[("HAM", "FRA")] == pytest.approx(112.0)
+    assert batch[("FRA", "STR")] == 0.0
+
+    # Źródło sprawdzane raz na wywołanie, nie na paczkę tras
+    checks = []
+    source = deal_filter._baseline_source
+    monkeypatch.setattr(deal_filter, "_ROUTES_PER_QUERY", 1)
+    monkeypatch.setattr(
+        deal_filter,
+        "_baseline_source",
+        lambda conn: checks.append(1) or source(conn),
+    )
+    assert load_baselines(str(db_file), routes) == batch
+    assert len(checks) == 1
+
+
+def test_filter_deals_by_score_uses_cache(monkeypatch):
+    from sniper_main import deal_filter
+
+    calls = []
+
+    def fake_load(db_path, routes, days=90):
+        routes = list(routes)
+        calls.append(sorted(routes))
+        return {route: 200.0 for route in routes}
+
+    monkeypatch.setattr(deal_filter, "load_baselines", fake_load)
+    clock = [0.0]
+    cache = deal_filter.BaselineCache(
+        "unused.db", ttl_s=60, clock=lambda: clock[0]
+    )
+    depart = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+    offers = [
+        {"origin": o, "destination": d, "price_pln": p, "depart_date": depart}
+        for o, d, p in [
+            ("FRA", "HAM", 120.0),
+            ("FRA", "HAM", 210.0),
+            ("HAM", "FRA", 100.0),
+            ("XXX", "HAM", 50.0),
+        ]
+    ]
+    cfg = {"min_score": 20.0}
+
+    kept = deal_filter.filter_deals_by_score(offers, cfg, cache)
+    assert [o["price_pln"] for o in kept] == [120.0, 100.0]
+    assert all(deal_filter.compute_deal_score(o, 200.0) >= 20 for o in kept)
+    assert len(calls) == 1 and len(calls[0]) == 3
+
+    deal_filter.filter_deals_by_score(offers, cfg, cache)
+    assert len(calls) == 1
+    clock[0] = 61.0
+    deal_filter.filter_deals_by_score(offers[:1], cfg, cache)
+    assert calls[-1] == [("FRA", "HAM")]
+
+    assert deal_filter.filter_deals_by_score(offers, {}, cache) == offers
+
+
+def test_vectorised_scoring_matches_scalar():
+    import random
+
+    import numpy as np
+
+    from sniper_main.deal_filter import (
+        compute_deal_scores,
+        is_good,
+        is_good_composite_many,
+        is_good_many,
+    )
+    from sniper_main.geo import AIRPORTS
+
+    rnd = random.Random(5)
+    codes = sorted(AIRPORTS)[:40]
+    now = datetime.now(timezone.utc)
+    rows = []
+    for n in range(3000):
+        depart = now + timedelta(days=rnd.randrange(-5, 120))
+        rows.append(
+            {
+                "origin": rnd.choice(codes),
+                "destination": rnd.choice(codes),
+                "price": rnd.choice([0.0, rnd.uniform(20, 3000)]),
+                "depart_date": rnd.choice(
+                    [None, depart.isoformat(), depart.date()]
+                ),
+                "trip_days": rnd.choice([None, rnd.randrange(1, 20)]),
+                "airline": rnd.choice([None, "FR", "LO", "W6"]),
+            }
+        )
+    baselines = [rnd.choice([0.0, rnd.uniform(50, 2500)]) for _ in rows]
+    cfg = {
+        "max_price": 2000.0,
+        "max_price_per_km": 1.5,
+        "min_score": 5.0,
+        "min_composite_score": 10.0,
+        "min_trip_days": 3,
+        "max_trip_days": 14,
+        "excluded_airlines": ["FR", "W6"],
+    }
+    columns = (
+        [r["price"] for r in rows],
+        [r["origin"] for r in rows],
+        [r["destination"] for r in rows],
+    )
+
+    scores = compute_deal_scores(
+        *columns, [r["depart_date"] for r in rows], baselines
+    )
+    assert scores.tolist() == [
+        compute_deal_score(r, b) for r, b in zip(rows, baselines)
+    ]
+    good = is_good_many(
+        *columns, [r["depart_date"] for r in rows], baselines, cfg
+    )
+    assert good.tolist() == [
+        is_good(r, cfg, b) for r, b in zip(rows, baselines)
+    ]
+    composite = is_good_composite_many(
+        *columns,
+        baselines,
+        cfg,
+        trip_days=[r["trip_days"] for r in rows],
+        airline=[r["airline"] for r in rows],
+    )
+    assert composite.tolist() == [
+        is_good_composite(r, cfg, b) for r, b in zip(rows, baselines)
+    ]
+    assert good.any() and composite.any()
+
+    unknown = compute_deal_scores([100.0], ["XXX"], ["FRA"], None, 200.0)
+    assert np.isnan(unknown[0])
+
+
+def test_scores_round_half_up_in_both_paths():
+    import numpy as np
+
+    from sniper_main.deal_filter import _round2, _round2_array
+
+    values = [2.675, 0.125, 1.005, 1.234]
+    assert [_round2(v) for v in values] == [2.68, 0.13, 1.01, 1.23]
+    assert _round2_array(np.array(values)).tolist() == [2.68, 0.13, 1.01, 1.23]
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from sniper_main.dispatcher import MAX_MESSAGE_CHARS, Dispatcher, TokenBucket
+
+
+class RetryAfter(Exception):
+    def __init__(self, retry_after):
+        super().__init__("flood control")
+        self.retry_after = retry_after
+
+
+def test_token_bucket_paces_after_burst():
+    now = [0.0]
+    bucket = TokenBucket(1.0, 2, clock=lambda: now[0])
+    for _ in range(2):
+        assert bucket.delay() == 0
+        bucket.take()
+    assert bucket.delay() == 1.0
+    now[0] = 0.5
+    assert bucket.delay() == 0.5
+
+
+def test_submit_does_not_block_and_batches_per_chat():
+    gate = threading.Event()
+    sent = []
+
+    def send(chat_id, text):
+        gate.wait(5)
+        sent.append((chat_id, text))
+
+    disp = Dispatcher(send, batch_window_s=0.05, sleep=lambda s: None)
+    for i in range(3):
+        disp.submit("a", f"msg{i}")
+    disp.submit("b", "other")
+    assert sent == []  # nothing delivered, yet submit returned
+    gate.set()
+    assert disp.flush(5)
+    assert sorted(sent) == [("a", "msg0\n\nmsg1\n\nmsg2"), ("b", "other")]
+    assert disp.sent == 4
+    disp.close(1)
+
+
+def test_higher_priority_jumps_the_backlog():
+    gate = threading.Event()
+    sent = []
+
+    def send(chat_id, text):
+        gate.wait(5)
+        sent.append(text)
+
+    disp = Dispatcher(send, batch_window_s=0, sleep=lambda s: None)
+    disp.submit(1, "first")
+    time.sleep(0.05)  # worker is now blocked sending "first"
+    disp.submit(1, "low", priority=0.1)
+    disp.submit(2, "high", priority=0.9)
+    gate.set()
+    assert disp.flush(5)
+    assert sent[0] == "first"
+    assert sent.index("high") < sent.index("low")
+    disp.close(1)
+
+
+def test_batches_respect_message_limit():
+    sent = []
+    disp = Dispatcher(
+        lambda c, t: sent.append(t), batch_window_s=0.05, sleep=lambda s: 0
+    )
+    chunk = "x" * (MAX_MESSAGE_CHARS // 2)
+    for _ in range(3):
+        disp.submit(1, chunk)
+    assert disp.flush(5)
+    assert all(len(t) <= MAX_MESSAGE_CHARS for t in sent)
+    assert sum(t.count("x") for t in sent) == 3 * len(chunk)
+    disp.close(1)
+
+
+def test_retries_honour_retry_after_and_report_failures():
+    sleeps, calls, done, failed = [], [], [], []
+
+    def flaky(chat_id, text):
+        calls.append(text)
+        if len(calls) == 1:
+            raise RetryAfter(7)
+
+    disp = Dispatcher(flaky, sleep=sleeps.append, batch_window_s=0)
+    disp.submit(1, "hi", on_sent=lambda: done.append(1))
+    assert disp.flush(5)
+    assert calls == ["hi", "hi"] and done == [1]
+    assert 7.0 in sleeps
+
+    def broken(chat_id, text):
+        raise RuntimeError("down")
+
+    disp2 = Dispatcher(
+        broken, max_retries=2, backoff_s=1, sleep=sleeps.append,
+        batch_window_s=0,
+    )
+    disp2.submit(1, "x", on_failed=failed.append)
+    assert disp2.flush(5)
+    assert len(failed) == 1 and isinstance(failed[0], RuntimeError)
+    assert disp2.failed == 1
+    disp.close(1)
+    disp2.close(1)
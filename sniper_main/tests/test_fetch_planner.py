@@ -0,0 +1,46 @@
+from sniper_main import geo
+from sniper_main.fetch_planner import expand_airports, plan_routes
+from sniper_main.geo import distance_km
+
+
+def test_expand_airports_dedups_overlaps():
+    assert expand_airports(["waw", "WMI"], 0) == ["WAW", "WMI"]
+
+    expanded = expand_airports(["WAW", "WMI", "XXX"], 100, max_extra=2)
+    assert expanded[:3] == ["WAW", "WMI", "XXX"]
+    assert len(expanded) == len(set(expanded))
+    for code in expanded[3:]:
+        assert min(distance_km(code, c) for c in ("WAW", "WMI")) <= 100
+
+
+def test_expand_airports_skips_city_codes_and_unserved():
+    # ROM is a city code; FCO and CIA are covered by a watched ROM
+    assert expand_airports(["FCO"], 60) == ["FCO", "CIA"]
+    assert expand_airports(["ROM"], 60) == ["ROM"]
+    assert "MIL" not in expand_airports(["LIN"], 60, max_extra=5)
+
+    assert expand_airports(["WAW"], 120, served=["LCJ", "WMI"]) == [
+        "WAW",
+        "WMI",
+        "LCJ",
+    ]
+
+
+def test_plan_routes_is_unique_and_skips_local_hops(tmp_path, monkeypatch):
+    monkeypatch.setattr(geo, "_CACHE_DIR", tmp_path)
+    routes = plan_routes(["WAW"], ["BCN", "WAW"], radius_km=100)
+    assert len(routes) == len(set(routes))
+    assert ("WAW", "BCN") in routes and ("WMI", "BCN") in routes
+    assert ("WAW", "WAW") not in routes
+    assert ("WMI", "WAW") not in routes  # added by expansion, 38 km apart
+    assert all(distance_km(o, d) >= 100 for o, d in routes)
+
+    # Watchlist routes shorter than the radius are kept
+    routes = plan_routes(["WAW"], ["KRK", "BCN"], radius_km=300)
+    assert ("WAW", "KRK") in routes
+    assert all(
+        distance_km(o, d) >= 300 for o, d in routes if (o, d) != ("WAW", "KRK")
+    )
+
+    assert plan_routes(["WAW"], ["BCN", "BCN"]) == [("WAW", "BCN")]
+    assert len(list(tmp_path.glob("distances-*.npy"))) == 2
@@ -0,0 +1,96 @@
+import pytest
+
+from sniper_main.geo import _RAD, airports_within, distance_km
+
+
+@pytest.mark.parametrize("radius", [50.0, 300.0, 1500.0, 9000.0])
+def test_airports_within_matches_brute_force(radius):
+    for code in ["FRA", "HAM", "KEF", "THU", "POM", "WKK"]:
+        expected = sorted(
+            (distance_km(code, other), other)
+            for other in _RAD
+            if distance_km(code, other) <= radius
+        )
+        assert airports_within(code, radius) == [o for _, o in expected]
+
+
+def test_airports_within_unknown_code():
+    with pytest.raises(KeyError):
+        airports_within("???", 100.0)
+
+
+def test_distance_engine_matches_scalar(tmp_path):
+    import numpy as np
+
+    from sniper_main import geo
+
+    codes = ["FRA", "HAM", "MUC", "XXX", "dus"]
+    orig = geo.airport_index(codes)
+    assert orig[3] == -1
+    # No truncation onto WAW / FRA
+    assert list(geo.airport_index(["WAWX", "EDDF", "FR", "WAŁ"])) == [-1] * 4
+
+    dist = geo.distance_km_many(orig, geo.airport_index(codes[::-1]))
+    for a, b, d in zip(codes, codes[::-1], dist):
+        if "XXX" in (a, b):
+            assert np.isnan(d)
+        else:
+            assert d == pytest.approx(geo.distance_km(a, b), abs=1e-9)
+
+    matrix = geo.distance_matrix(codes, ["HAM", "STR"], cache_dir=tmp_path)
+    assert matrix.origins == ["DUS", "FRA", "HAM", "MUC"]
+    assert matrix.get("FRA", "STR") == pytest.approx(
+        geo.distance_km("FRA", "STR"), abs=1e-9
+    )
+    assert matrix.get("FRA", "CGN") == geo.distance_km("FRA", "CGN")
+    assert np.isnan(matrix.lookup(["FRA", "CGN"], ["HAM", "HAM"])[1])
+    cached = list(tmp_path.glob("distances-*.npy"))
+    assert len(cached) == 1
+
+    geo._matrices.clear()
+    reloaded = geo.distance_matrix(
+        ["FRA", "HAM", "MUC", "DUS"], ["STR", "HAM"], cache_dir=tmp_path
+    )
+    assert np.array_equal(reloaded.km, matrix.km)
+
+
+def test_airport_table_lookup_and_build(tmp_path):
+    from sniper_main import build_airports, geo
+
+    for code in ["WAW", "BCN", "CNX", "HND", "ROM", "MIL"]:
+        assert code in geo.AIRPORTS
+    assert "XXX" not in geo.AIRPORTS
+    codes = list(geo.AIRPORTS)
+    assert codes == sorted(codes) and len(codes) > 7000
+    assert geo.AIRPORTS["KEF"] == pytest.approx((63.985, -22.6056), abs=1e-4)
+
+    src = tmp_path / "airports.csv"
+    src.write_text(
+        "iata_code,latitude_deg,longitude_deg\n"
+        "WAW,52.1657,20.9671\nWMI,52.4511,20.6518\n,1,2\nBAD,x,y\n"
+    )
+    macs = tmp_path / "macs.csv"
+    macs.write_text(
+        "Country,City Code,City Name,Airport Code,Airport Name\n"
+        "PL,WAR,Warsaw,WAW,Chopin\nPL,WAR,Warsaw,WMI,Modlin\n"
+    )
+    out = tmp_path / "airports.bin"
+    assert build_airports.build(src, macs, out) == 3
+
+    table = geo._AirportTable(out)
+    assert [c.decode() for c in table.codes] == ["WAR", "WAW", "WMI"]
+    assert table.find("WMI") == 2 and table.find("KRK") == -1
+    assert table.lat[0] == pytest.approx((52.1657 + 52.4511) / 2, abs=1e-5)
+
+
+def test_nearest_airports_matches_sorted_distances():
+    from sniper_main.geo import nearest_airports
+
+    for code in ["WAW", "KEF", "THU"]:
+        expected = sorted(
+            (distance_km(code, other), other)
+            for other in _RAD
+            if other != code
+        )[:5]
+        assert nearest_airports(code, 5) == [c for _, c in expected]
+    assert nearest_airports("WAW", 5, max_km=50) == ["WMI"]
@@ -3,7 +3,7 @@ import sqlite3
 from datetime import datetime, timezone, date
 from decimal import Decimal
 
-from sniper_main.db import init_db, insert_offer
+from sniper_main.db import backfill_daily_min, init_db, insert_offer
 from sniper_main.models import FlightOffer
 
 
@@ -46,3 +46,41 @@ def test_insert_offer_deduplicates(tmp_path):
     conn.close()
 
     assert count == 1
+
+
+def test_insert_offer_maintains_daily_min(tmp_path):
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+
+    offer = make_offer()
+    insert_offer(offer, db_path=str(db_file))
+    offer.price_pln = Decimal("450")
+    insert_offer(offer, db_path=str(db_file))
+    offer.price_pln = Decimal("480")
+    insert_offer(offer, db_path=str(db_file))
+
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute(
+        "SELECT origin, destination, day, min_price FROM route_daily_min"
+    ).fetchall()
+    conn.close()
+    day = offer.fetched_at.date().isoformat()
+    assert rows == [("WAW", "JFK", day, 450)]
+
+    conn = sqlite3.connect(db_file)
+    conn.execute("DELETE FROM route_daily_min")
+    conn.commit()
+    conn.close()
+    assert backfill_daily_min(db_path=str(db_file)) == 1
+
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT min_price FROM route_daily_min").fetchall()
+    conn.close()
+    assert rows == [(450,)]
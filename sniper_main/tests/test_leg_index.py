@@ -0,0 +1,192 @@
+import os
+import sqlite3
+from datetime import date, datetime, timezone
+
+from sniper_main.db import init_db
+from sniper_main.leg_index import LegIndex
+
+
+def test_window_filters_dates_and_stops(tmp_path):
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+
+    conn = sqlite3.connect(db_file)
+    legs = [
+        ("BCN", "WAW", "2025-05-03", 90, 0),
+        ("BCN", "WAW", "2025-05-10", 80, 1),
+        ("BCN", "WAW", "2025-05-12", 70, 3),
+        ("BCN", "WAW", "2025-06-20", 60, 0),
+        ("WAW", "BCN", "2025-05-05", 50, 0),
+        ("BCN", "WAW", "2025-5-7", 40, 0),  # malformed, skipped
+    ]
+    for n, (origin, dest, depart, price, stops) in enumerate(legs):
+        conn.execute(
+            "INSERT INTO offers_raw (origin, destination, depart_date, "
+            "price_pln, stops, deep_link, fetched_at) VALUES (?,?,?,?,?,?,?)",
+            (
+                origin,
+                dest,
+                depart,
+                price,
+                stops,
+                f"/l{n}",
+                datetime.now(timezone.utc).isoformat(),
+            ),
+        )
+    conn.commit()
+    conn.close()
+
+    index = LegIndex.from_db(str(db_file), since=date(2025, 1, 1))
+    assert len(index) == 5
+
+    from_index = index.window(
+        "BCN", "WAW", date(2025, 5, 3), date(2025, 6, 1), 2
+    )
+    assert from_index == [
+        (1, 90.0, date(2025, 5, 3)),
+        (2, 80.0, date(2025, 5, 10)),
+    ]
+
+    only = LegIndex.from_db(
+        str(db_file), since=date(2025, 1, 1), routes=[("WAW", "BCN")]
+    )
+    assert len(only) == 1
+    assert ("WAW", "BCN") in only and ("BCN", "WAW") not in only
+
+
+def test_from_rows_sorts_and_dedupes():
+    index = LegIndex.from_rows(
+        [
+            (3, "BCN", "WAW", date(2025, 5, 9), 30.0, 0),
+            (1, "BCN", "WAW", date(2025, 5, 1), 10.0, 0),
+            (2, "BCN", "WAW", date(2025, 5, 5), 20.0, 0),
+            (2, "BCN", "WAW", date(2025, 5, 5), 20.0, 0),
+        ]
+    )
+
+    assert len(index) == 3
+    rows = index.window("BCN", "WAW", date(2025, 5, 1), date(2025, 5, 9), 0)
+    assert [r[0] for r in rows] == [1, 2, 3]
+    empty = index.window("WAW", "BCN", date(2025, 5, 1), date(2025, 6, 1), 0)
+    assert empty == []
+
+
+def test_top_k_returns_matches_brute_force():
+    import random
+
+    from sniper_main.leg_index import top_k_per_week, top_k_returns
+
+    rnd = random.Random(7)
+    base = date(2025, 5, 1).toordinal()
+    outs = sorted(
+        (base + rnd.randrange(60), float(rnd.randrange(50, 500)), n)
+        for n in range(80)
+    )
+    ins = sorted(
+        (base + rnd.randrange(90), float(rnd.randrange(50, 500)), 1000 + n)
+        for n in range(120)
+    )
+    k = 3
+
+    got = top_k_returns(outs, ins, 2, 14, k)
+
+    expected = []
+    for o_day, o_price, o_id in outs:
+        window = [
+            (price, day, leg_id)
+            for day, price, leg_id in ins
+            if o_day + 2 <= day <= o_day + 14
+        ]
+        expected.extend((o_id, leg_id) for _, _, leg_id in sorted(window)[:k])
+    assert sorted((p[0], p[1]) for p in got) == sorted(expected)
+
+    weekly = top_k_per_week(got, k)
+    weeks = {}
+    for pair in weekly:
+        weeks.setdefault(pair[2].strftime("%Y-%W"), []).append(pair)
+    assert all(len(v) <= k for v in weeks.values())
+    for week, kept in weeks.items():
+        cutoff = max(p[4] + p[5] for p in kept)
+        dropped = [
+            p
+            for p in got
+            if p[2].strftime("%Y-%W") == week and p not in kept
+        ]
+        assert all(p[4] + p[5] >= cutoff for p in dropped)
+
+
+def test_legs_between_merges_routes_by_date():
+    index = LegIndex.from_rows(
+        [
+            (1, "BCN", "WAW", date(2025, 5, 9), 30.0, 0),
+            (2, "GRO", "WAW", date(2025, 5, 3), 20.0, 0),
+            (3, "GRO", "WMI", date(2025, 5, 6), 25.0, 0),
+            (4, "GRO", "KRK", date(2025, 5, 1), 10.0, 0),
+        ]
+    )
+
+    legs = index.legs_between(
+        ["BCN", "GRO"], ["WAW", "WMI"], 2, exclude=("BCN", "WAW")
+    )
+    assert [leg_id for _, _, leg_id in legs] == [2, 3]
+    assert index.route_of(3) == ("GRO", "WMI")
+
+
+def test_pair_routes_parallel_matches_serial(tmp_path):
+    import random
+
+    from sniper_main.leg_index import pair_routes
+
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+
+    rnd = random.Random(3)
+    codes = ["WAW", "BCN", "KRK", "LIS", "ROM"]
+    routes = [(o, d) for o in codes for d in codes if o != d]
+    start = date.today().toordinal()
+    conn = sqlite3.connect(db_file)
+    for n in range(400):
+        origin, dest = rnd.choice(routes)
+        conn.execute(
+            "INSERT INTO offers_raw (origin, destination, depart_date, "
+            "price_pln, stops, deep_link, fetched_at) VALUES (?,?,?,?,?,?,?)",
+            (
+                origin,
+                dest,
+                date.fromordinal(start + rnd.randrange(60)).isoformat(),
+                rnd.randrange(50, 500),
+                0,
+                f"/l{n}",
+                datetime.now(timezone.utc).isoformat(),
+            ),
+        )
+    for origin, dest in routes:
+        conn.execute(
+            "INSERT INTO route_thresholds VALUES (?,?,?,?,?)",
+            (origin, dest, 300, 240, "2025-01-01"),
+        )
+    conn.commit()
+    conn.close()
+
+    params = dict(min_days=2, max_days=14, max_stops=1, k=3)
+    serial = pair_routes(str(db_file), routes, workers=1, **params)
+    parallel = pair_routes(str(db_file), routes, workers=2, **params)
+
+    assert serial and sorted(serial) == sorted(parallel)
+    assert {r[2:4] for r in serial} <= set(routes)
+    for row in serial:
+        assert row[8] == (row[6] <= 240 and row[7] <= 240)
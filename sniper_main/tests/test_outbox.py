@@ -0,0 +1,271 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sniper_main.db import (
+    enqueue_alert,
+    init_db,
+    insert_offer,
+    insert_pairs_since,
+    transaction,
+)
+from sniper_main.models import FlightOffer
+from sniper_main.outbox import alert_latencies, claim_due, flush_outbox
+
+
+def setup_db(tmp_path):
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+    return str(db_file)
+
+
+def make_offer(origin="WAW", dest="JFK", depart=date(2025, 9, 10), price=500):
+    return FlightOffer(
+        origin=origin,
+        destination=dest,
+        depart_date=depart,
+        return_date=None,
+        price_pln=Decimal(price),
+        airline="AA",
+        stops=0,
+        total_flight_time_h=None,
+        max_layover_h=None,
+        deep_link=f"https://example.com/{origin}{dest}{depart}",
+        fetched_at=datetime.now(timezone.utc),
+    )
+
+
+def outbox(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT idem_key, status, attempts, text FROM alerts_outbox "
+        "ORDER BY id"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def make_due(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "UPDATE alerts_outbox SET next_attempt_at = datetime('now', '-1 day')"
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_offer_alert_is_queued_once_with_the_offer(tmp_path):
+    db_path = setup_db(tmp_path)
+    offer = make_offer()
+    offer_id = insert_offer(offer, db_path=db_path, alert_text="STEAL")
+    assert insert_offer(offer, db_path=db_path, alert_text="STEAL") == offer_id
+    insert_offer(make_offer(price=900), db_path=db_path)
+
+    assert outbox(db_path) == [(f"offer:{offer_id}", "pending", 0, "STEAL")]
+
+
+def test_flush_marks_sent_and_flags_offer(tmp_path):
+    db_path = setup_db(tmp_path)
+    offer_id = insert_offer(make_offer(), db_path=db_path, alert_text="hi")
+    sent = []
+
+    def send(text, on_sent, on_failed, priority=0.0):
+        sent.append(text)
+        on_sent()
+
+    assert flush_outbox(send, db_path) == 1
+    assert flush_outbox(send, db_path) == 0
+    assert sent == ["hi"]
+    assert outbox(db_path)[0][1:3] == ("sent", 1)
+    conn = sqlite3.connect(db_path)
+    flag = conn.execute(
+        "SELECT alert_sent FROM offers_raw WHERE id = ?", (offer_id,)
+    ).fetchone()[0]
+    conn.close()
+    assert flag == 1
+
+
+def test_failures_back_off_then_give_up(tmp_path):
+    db_path = setup_db(tmp_path)
+    insert_offer(make_offer(), db_path=db_path, alert_text="hi")
+
+    def send(text, on_sent, on_failed, priority=0.0):
+        on_failed(RuntimeError("down"))
+
+    assert flush_outbox(send, db_path, max_attempts=2) == 1
+    assert outbox(db_path)[0][1:3] == ("pending", 1)
+    assert claim_due(db_path) == []  # backing off
+
+    make_due(db_path)
+    assert flush_outbox(send, db_path, max_attempts=2) == 1
+    assert outbox(db_path)[0][1:3] == ("failed", 2)
+    make_due(db_path)
+    assert claim_due(db_path) == []
+
+
+def test_unacknowledged_alert_is_retried_after_lease(tmp_path):
+    db_path = setup_db(tmp_path)
+    insert_offer(make_offer(), db_path=db_path, alert_text="hi")
+
+    # Simulated crash: the row is claimed but never reported back.
+    assert len(claim_due(db_path, lease_s=300)) == 1
+    assert claim_due(db_path) == []
+    make_due(db_path)
+    assert [a.text for a in claim_due(db_path)] == ["hi"]
+
+
+def test_queued_alerts_are_not_reclaimed_after_lease(tmp_path):
+    db_path = setup_db(tmp_path)
+    insert_offer(make_offer(), db_path=db_path, alert_text="hi")
+    queued = []
+
+    def send(text, on_sent, on_failed, priority=0.0):
+        queued.append(on_sent)  # still waiting in the dispatcher
+
+    in_flight = set()
+    assert flush_outbox(send, db_path, in_flight=in_flight) == 1
+    make_due(db_path)  # lease ran out while queued
+    assert flush_outbox(send, db_path, in_flight=in_flight) == 0
+    assert len(queued) == 1
+
+    queued[0]()
+    assert in_flight == set()
+    assert outbox(db_path)[0][1] == "sent"
+
+
+def test_route_bursts_are_coalesced_into_one_digest(tmp_path):
+    db_path = setup_db(tmp_path)
+    for day in range(1, 13):
+        offer = make_offer("WAW", "BCN", date(2025, 5, day), 100 + day)
+        insert_offer(offer, db_path, alert_text=f"BCN {100 + day}")
+    insert_offer(make_offer(), db_path, alert_text="JFK 500")
+    sent = []
+
+    def send(text, on_sent, on_failed, priority=0.0):
+        sent.append(text)
+        on_sent()
+
+    # Held while the route's window is open
+    assert flush_outbox(send, db_path, window_s=3600) == 0
+    assert flush_outbox(send, db_path, batch_size=5, top_n=3) == 13
+    assert len(sent) == 2
+    bcn = sent[0].split("\n\n")
+    assert bcn[1:4] == ["BCN 101", "BCN 102", "BCN 103"]
+    assert "×12" in bcn[0] and bcn[-1] == "… i 9 więcej"
+    assert sent[1] == "JFK 500"
+    statuses = [status for _, status, _, _ in outbox(db_path)]
+    assert statuses == ["sent"] * 3 + ["digested"] * 9 + ["sent"]
+
+    # Only the alerts shown in a message reach the daily report
+    conn = sqlite3.connect(db_path)
+    logged = conn.execute("SELECT price FROM steals ORDER BY price").fetchall()
+    conn.close()
+    assert logged == [(101.0,), (102.0,), (103.0,), (500.0,)]
+
+
+def test_biggest_and_soonest_deals_go_first(tmp_path):
+    db_path = setup_db(tmp_path)
+    today = date.today()
+    soon = today + timedelta(days=2)
+    later = today + timedelta(days=200)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO route_thresholds VALUES (?,?,1000,900,'2025-01-01')",
+        [("WAW", "BCN"), ("WAW", "ROM"), ("WAW", "LIS")],
+    )
+    conn.commit()
+    conn.close()
+    insert_offer(make_offer("WAW", "BCN", later, 800), db_path, "BCN -20%")
+    insert_offer(make_offer("WAW", "ROM", later, 500), db_path, "ROM -50%")
+    insert_offer(make_offer("WAW", "LIS", soon, 700), db_path, "LIS -30%")
+    sent = []
+
+    def send(text, on_sent, on_failed, priority=0.0):
+        sent.append((text, round(priority, 2)))
+        on_sent()
+
+    flush_outbox(send, db_path, horizon_days=30, proximity_weight=1.0)
+    # LIS: 0.3 × (1 + 28/30) beats ROM's 0.5 far in the future
+    assert [text for text, _ in sent] == ["LIS -30%", "ROM -50%", "BCN -20%"]
+    assert sent[1][1] == 0.5
+
+    latencies = alert_latencies(db_path, top=2)
+    assert [round(disc, 2) for _, disc, _ in latencies] == [0.5, 0.3]
+    assert all(0 <= sec < 60 for _, _, sec in latencies)
+
+
+def test_model_discount_ranks_alerts_on_routes_without_history(tmp_path):
+    db_path = setup_db(tmp_path)
+    later = date.today() + timedelta(days=200)
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO route_thresholds VALUES "
+        "('WAW','BCN',1000,900,'2025-01-01')"
+    )
+    conn.commit()
+    conn.close()
+    new_route = insert_offer(make_offer("WAW", "ATH", later, 300), db_path)
+    known = insert_offer(make_offer("WAW", "BCN", later, 800), db_path)
+    with transaction(db_path) as conn:
+        enqueue_alert(conn, "offer", new_route, "ATH", discount=0.6)
+        # The 30-day average wins over the model where there is one
+        enqueue_alert(conn, "offer", known, "BCN", discount=0.9)
+    sent = []
+
+    def send(text, on_sent, on_failed, priority=0.0):
+        sent.append((text, round(priority, 2)))
+        on_sent()
+
+    flush_outbox(send, db_path, horizon_days=30, proximity_weight=0.0)
+    assert sent == [("ATH", 0.6), ("BCN", 0.2)]
+
+
+def test_pair_alerts_are_queued_with_the_pairs(tmp_path):
+    db_path = setup_db(tmp_path)
+    insert_offer(make_offer("WAW", "BCN", date(2025, 5, 1), 100), db_path)
+    insert_offer(make_offer("BCN", "WAW", date(2025, 5, 6), 100), db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO route_thresholds VALUES (?,?,400,300,'2025-01-01')",
+        [("WAW", "BCN"), ("BCN", "WAW")],
+    )
+    conn.commit()
+    conn.close()
+
+    steals = insert_pairs_since(
+        0, 3, 10, 1, db_path, alert=lambda row: f"pair {row[0]}"
+    )
+    assert len(steals) == 1
+    pair_id = steals[0][0]
+    assert outbox(db_path) == [
+        (f"pair:{pair_id}", "pending", 0, f"pair {pair_id}")
+    ]
+
+
+def test_sent_alerts_are_logged_as_steals(tmp_path):
+    db_path = setup_db(tmp_path)
+    for day in (1, 2):
+        offer = make_offer("WAW", "BCN", date(2025, 5, day), 100 + day)
+        insert_offer(offer, db_path, alert_text=f"BCN {day}")
+    insert_offer(make_offer(), db_path, alert_text="JFK")
+
+    def send(text, on_sent, on_failed, priority=0.0):
+        if text != "JFK":
+            on_sent()
+
+    flush_outbox(send, db_path)
+    flush_outbox(send, db_path)  # nothing due; nothing logged twice
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT kind, destination, price FROM steals ORDER BY price"
+    ).fetchall()
+    conn.close()
+    assert rows == [("offer", "BCN", 101.0), ("offer", "BCN", 102.0)]
@@ -0,0 +1,183 @@
+import os
+import sqlite3
+from datetime import datetime, timezone, timedelta
+
+from sniper_main import aggregator
+from sniper_main.db import (
+    init_db,
+    insert_pairs_since,
+    last_offer_id,
+    load_route_thresholds,
+)
+
+
+def setup_db(tmp_path):
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+    return str(db_file)
+
+
+def add_leg(db_path, origin, dest, depart, price, stops=0):
+    conn = sqlite3.connect(db_path)
+    cur = conn.execute(
+        "INSERT INTO offers_raw (origin, destination, depart_date, "
+        "price_pln, stops, deep_link, fetched_at) VALUES (?,?,?,?,?,?,?)",
+        (
+            origin,
+            dest,
+            depart,
+            price,
+            stops,
+            f"{origin}{dest}{depart}{price}",
+            datetime.now(timezone.utc).isoformat(),
+        ),
+    )
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+
+def pairs(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT out_id, in_id, price_total_pln, steal_pair "
+        "FROM offers_pair ORDER BY out_id, in_id"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_insert_pairs_since_only_new_legs(tmp_path):
+    db_path = setup_db(tmp_path)
+    old_out = add_leg(db_path, "WAW", "BCN", "2025-05-01", 100)
+    old_in = add_leg(db_path, "BCN", "WAW", "2025-05-20", 120)
+
+    first_id = last_offer_id(db_path)
+    new_in = add_leg(db_path, "BCN", "WAW", "2025-05-05", 90)
+    short = add_leg(db_path, "BCN", "WAW", "2025-05-02", 80)
+    add_leg(db_path, "BCN", "WAW", "2025-05-06", 70, stops=3)
+    new_out = add_leg(db_path, "WAW", "BCN", "2025-05-10", 110)
+
+    insert_pairs_since(
+        first_id,
+        min_trip_days=2,
+        max_trip_days=30,
+        max_stops=2,
+        db_path=db_path,
+    )
+    # Every leg is an outbound candidate; old_out/old_in is not considered
+    # because neither leg is new in this run, and old_out -> short is a
+    # one-day trip.
+    assert pairs(db_path) == [
+        (old_out, new_in, 190, 0),
+        (new_in, new_out, 200, 0),
+        (short, new_out, 190, 0),
+        (new_out, old_in, 230, 0),
+    ]
+
+    # A full re-run only adds the old pair (ON CONFLICT DO NOTHING).
+    insert_pairs_since(0, 2, 30, 2, db_path=db_path)
+    assert len(pairs(db_path)) == 5
+
+
+def test_insert_pairs_since_flags_steals(tmp_path):
+    db_path = setup_db(tmp_path)
+    today = datetime.now(timezone.utc).date().isoformat()
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO offers_agg VALUES (?,?,?,?)",
+        [("WAW", "BCN", today, 200), ("BCN", "WAW", today, 200)],
+    )
+    conn.commit()
+    conn.close()
+    stored = aggregator.store_route_thresholds(
+        db_path, offer_k=1.0, pair_threshold=0.2
+    )
+    assert stored == 2
+    assert load_route_thresholds(db_path)[("WAW", "BCN")] == 160
+
+    start = (datetime.now(timezone.utc) + timedelta(days=20)).date()
+    out_id = add_leg(db_path, "WAW", "BCN", start.isoformat(), 150)
+    in_id = add_leg(
+        db_path, "BCN", "WAW", (start + timedelta(days=7)).isoformat(), 140
+    )
+    add_leg(
+        db_path, "BCN", "WAW", (start + timedelta(days=8)).isoformat(), 190
+    )
+
+    steals = insert_pairs_since(0, 2, 30, 2, db_path=db_path)
+    assert len(steals) == 1
+    pair_id, origin, dest, _, _, price_out, price_in, ret_from, ret_to = (
+        steals[0]
+    )
+    assert (origin, dest, price_out, price_in) == ("WAW", "BCN", 150, 140)
+    assert (ret_from, ret_to) == ("BCN", "WAW")
+    assert [p[:2] for p in pairs(db_path) if p[3]] == [(out_id, in_id)]
+
+
+def test_insert_top_pairs_trims_per_week(tmp_path):
+    from sniper_main.db import insert_top_pairs
+
+    db_path = setup_db(tmp_path)
+    outs = [
+        add_leg(db_path, "WAW", "BCN", "2025-05-05", 100 + n)
+        for n in range(3)
+    ]
+    ret = add_leg(db_path, "BCN", "WAW", "2025-05-12", 100)
+
+    rows = [
+        (out_id, ret, "WAW", "BCN", "2025-05-05", "2025-05-12")
+        + (100 + n, 100, n == 0)
+        for n, out_id in enumerate(outs)
+    ]
+    steals = insert_top_pairs(rows, [("WAW", "BCN")], 2, db_path=db_path)
+    assert [s[0] for s in steals] == [1]
+    assert [(p[0], p[2]) for p in pairs(db_path)] == [
+        (outs[0], 200),
+        (outs[1], 201),
+    ]
+
+
+def test_insert_top_pairs_trim_spares_open_jaw_and_steals(tmp_path):
+    from sniper_main.db import insert_top_pairs
+
+    db_path = setup_db(tmp_path)
+    outs = [
+        add_leg(db_path, "WAW", "BCN", "2025-05-05", 100 + n)
+        for n in range(3)
+    ]
+    ret = add_leg(db_path, "BCN", "WAW", "2025-05-12", 100)
+    jaw = add_leg(db_path, "GRO", "WAW", "2025-05-12", 50)
+
+    # Open-jaw pairs first: cheaper than any plain pair of the week
+    insert_top_pairs(
+        [
+            (out_id, jaw, "WAW", "BCN", "2025-05-05", "2025-05-12")
+            + (100 + n, 50, False)
+            for n, out_id in enumerate(outs)
+        ],
+        [],
+        1,
+        db_path=db_path,
+    )
+    # The most expensive plain pair is a STEAL
+    rows = [
+        (out_id, ret, "WAW", "BCN", "2025-05-05", "2025-05-12")
+        + (100 + n, 100, n == 2)
+        for n, out_id in enumerate(outs)
+    ]
+    insert_top_pairs(rows, [("WAW", "BCN")], 1, db_path=db_path)
+
+    kept = [(p[0], p[1]) for p in pairs(db_path)]
+    assert [k for k in kept if k[1] == jaw] == [(o, jaw) for o in outs]
+    assert [k for k in kept if k[1] == ret] == [
+        (outs[0], ret),
+        (outs[2], ret),
+    ]
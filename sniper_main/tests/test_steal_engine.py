@@ -0,0 +1,81 @@
+import os
+import sqlite3
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from sniper_main import aggregator
+from sniper_main.db import init_db, load_offer_thresholds
+from sniper_main.models import FlightOffer
+from sniper_main.steal_engine import is_offer_steal
+
+
+def make_offer(origin, dest, price, depart=date(2025, 5, 5)):
+    return FlightOffer(
+        origin=origin,
+        destination=dest,
+        depart_date=depart,
+        return_date=None,
+        price_pln=Decimal(price),
+        airline="LO",
+        stops=0,
+        total_flight_time_h=None,
+        max_layover_h=None,
+        deep_link="/x",
+        fetched_at=datetime(2025, 5, 1),
+    )
+
+
+def test_is_offer_steal_uses_weekday_limit():
+    # 2025-05-05 is a Monday
+    limits = {("WAW", "BCN", 0): 180.0}
+
+    assert is_offer_steal(make_offer("WAW", "BCN", "179"), limits)
+    assert not is_offer_steal(make_offer("WAW", "BCN", "180"), limits)
+    # No history for Tuesday or for the reverse direction
+    tuesday = date(2025, 5, 6)
+    assert not is_offer_steal(make_offer("WAW", "BCN", "10", tuesday), limits)
+    assert not is_offer_steal(make_offer("BCN", "WAW", "10"), limits)
+
+
+def test_offer_limit_is_weekday_avg_minus_k_std(tmp_path):
+    db_file = tmp_path / "test.db"
+    migrations_dir = os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "..",
+        "sniper_main",
+        "migrations",
+    )
+    init_db(str(db_file), migrations_dir=migrations_dir)
+    conn = sqlite3.connect(db_file)
+    legs = [
+        ("2025-05-05", 100),
+        ("2025-05-12", 200),
+        ("2025-05-06", 1000),
+    ]
+    for n, (depart, price) in enumerate(legs):
+        conn.execute(
+            "INSERT INTO offers_raw (origin, destination, depart_date, "
+            "price_pln, deep_link, fetched_at) VALUES (?,?,?,?,?,?)",
+            (
+                "WAW",
+                "BCN",
+                depart,
+                price,
+                f"/l{n}",
+                datetime.now(timezone.utc).isoformat(),
+            ),
+        )
+    conn.commit()
+    conn.close()
+
+    aggregator.store_weekday_averages(str(db_file))
+    aggregator.store_route_thresholds(
+        str(db_file), offer_k=1.0, pair_threshold=0.2
+    )
+    limits = load_offer_thresholds(str(db_file))
+
+    # Monday: 150 - 1 * 50; Tuesday has a single price, so std is 0
+    assert limits == {("WAW", "BCN", 0): 100.0, ("WAW", "BCN", 1): 1000.0}
+    assert is_offer_steal(make_offer("WAW", "BCN", "99"), limits)
+    assert not is_offer_steal(make_offer("WAW", "BCN", "100"), limits)